@@ -0,0 +1,444 @@
+import asyncio
+import hashlib
+import io
+import mimetypes
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import mutagen
+from PIL import Image
+from sqlalchemy import select, union
+
+from .background import BackgroundJob
+from .config import settings
+from .models import Album, Artist, Track, artist_in, read_session
+from .serializers import THUMBNAIL_SIZES, file_version
+
+
+class ArtCache:
+    """Album art stored on disk by content digest, with its thumbnails.
+
+    Each distinct image is written once under ``root``, so the tracks of an
+    album sharing a cover share one file, and so do its thumbnails. An
+    index maps each file version, ``(path, size, mtime)`` of an audio file
+    or a folder image, to its image. The most recently used images and
+    thumbnails are kept in memory up to ``max_bytes``. Methods block and
+    are safe to call from worker threads.
+    """
+
+    # File versions whose image is remembered in memory
+    MAX_VERSIONS = 16384
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.images = OrderedDict()  # image name -> bytes
+        self.size = 0
+        self.versions = OrderedDict()  # (path, size, mtime) -> (digest, mime)
+        self.lock = threading.Lock()
+
+        root.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(root / "index.db", check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS art (
+                file_path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL,
+                digest TEXT NOT NULL,
+                mime TEXT NOT NULL
+            ) WITHOUT ROWID
+            """
+        )
+
+    def get_cached(self, key: tuple, size: Optional[int] = None) -> Optional[tuple]:
+        """``(data, mime)`` from memory, or None. Cheap enough for the event loop."""
+        with self.lock:
+            version = self.versions.get(key)
+            if version is None:
+                return None
+            name, mime = _image_name(*version, size)
+            data = self.images.get(name)
+            if data is None:
+                return None
+            self.versions.move_to_end(key)
+            self.images.move_to_end(name)
+            return data, mime
+
+    def get(
+        self,
+        key: tuple,
+        full_path: Path,
+        extract=None,
+        size: Optional[int] = None,
+    ) -> Optional[tuple]:
+        """``(data, mime)`` of a file version's art, or of its ``size`` thumbnail.
+
+        ``key`` is ``(path, size, mtime)`` of the file holding the art, which
+        ``extract`` reads as ``(data, mime)``, embedded art by default. Art
+        not seen before is extracted and thumbnails not seen before are
+        rendered. Returns None if the file holds no readable art.
+        """
+        version = self._version(key)
+        if version is not None:
+            found = self._load(version, size)
+            if found:
+                return found
+
+        # New or changed file, or its image went missing from disk
+        version, data = self._add(key, full_path, extract or extract_embedded_art)
+        if version is None:
+            return None
+        if size is None:
+            return data, version[1]
+        return self._render(version[0], data, [size])[size]
+
+    def prerender(self, key: tuple, full_path: Path, extract=None):
+        """Render any missing thumbnails of a file version's art.
+
+        The image is decoded once for all sizes. Nothing is kept in memory,
+        so a background run doesn't push out the images in use.
+        """
+        version = self._version(key)
+        if version is not None:
+            missing = [
+                size for size in THUMBNAIL_SIZES
+                if not self._path(_image_name(*version, size)[0]).exists()
+            ]
+            if not missing:
+                return
+            data = self._read(version[0], remember=False)
+        if version is None or data is None:
+            version, data = self._add(
+                key, full_path, extract or extract_embedded_art, remember=False
+            )
+            if version is None:
+                return
+            missing = THUMBNAIL_SIZES
+        self._render(version[0], data, missing, remember=False)
+
+    def sweep(self, paths: set) -> int:
+        """Forget art of files not in ``paths`` and delete images nothing uses.
+
+        Images written in the last minute are kept, since their index row
+        may not be written yet. Returns the number of files deleted.
+        """
+        started = time.time()
+        with self.lock:
+            gone = [
+                row for row in self.conn.execute("SELECT file_path FROM art")
+                if row[0] not in paths
+            ]
+            with self.conn:
+                self.conn.executemany("DELETE FROM art WHERE file_path = ?", gone)
+            digests = {row[0] for row in self.conn.execute("SELECT DISTINCT digest FROM art")}
+            for key in [key for key in self.versions if key[0] not in paths]:
+                del self.versions[key]
+
+        deleted = 0
+        for path in self.root.glob("*/*"):
+            # Thumbnails are named after their original's digest
+            digest = path.name.split("-")[0]
+            if len(digest) != 32 or digest in digests:
+                continue
+            try:
+                if path.stat().st_mtime > started - 60:
+                    continue
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            deleted += 1
+            with self.lock:
+                data = self.images.pop(path.name, None)
+                if data is not None:
+                    self.size -= len(data)
+        return deleted
+
+    def _version(self, key: tuple) -> Optional[tuple]:
+        """``(digest, mime)`` of a file version already extracted, or None."""
+        with self.lock:
+            version = self.versions.get(key)
+            if version is not None:
+                return version
+            version = self.conn.execute(
+                "SELECT digest, mime FROM art WHERE file_path = ? AND size = ? AND mtime = ?",
+                key,
+            ).fetchone()
+        if version is not None:
+            self._remember_version(key, version)
+        return version
+
+    def _load(self, version: tuple, size: Optional[int]) -> Optional[tuple]:
+        """An image or thumbnail already on disk, rendering the thumbnail if needed."""
+        name, mime = _image_name(*version, size)
+        data = self._read(name)
+        if data is not None:
+            return data, mime
+        if size is None:
+            return None
+        original = self._read(version[0], remember=False)
+        if original is None:
+            return None
+        return self._render(version[0], original, [size])[size]
+
+    def _add(self, key: tuple, full_path: Path, extract, remember: bool = True) -> tuple:
+        """Extract a file version's art and store it, returning ``(version, data)``."""
+        extracted = extract(full_path)
+        if extracted is None:
+            return None, None
+        data, mime = extracted
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        self._write(digest, data)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO art (file_path, size, mtime, digest, mime) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (*key, digest, mime),
+            )
+        version = (digest, mime)
+        if remember:
+            self._remember(digest, data)
+        self._remember_version(key, version)
+        return version, data
+
+    def _render(self, digest: str, data: bytes, sizes: list, remember: bool = True) -> dict:
+        """Render, store and return ``{size: (data, mime)}`` thumbnails."""
+        thumbnails = {}
+        for size, thumbnail in render_thumbnails(data, sizes).items():
+            name, mime = _image_name(digest, None, size)
+            self._write(name, thumbnail)
+            if remember:
+                self._remember(name, thumbnail)
+            thumbnails[size] = (thumbnail, mime)
+        return thumbnails
+
+    def _path(self, name: str) -> Path:
+        return self.root / name[:2] / name
+
+    def _read(self, name: str, remember: bool = True) -> Optional[bytes]:
+        with self.lock:
+            data = self.images.get(name)
+        if data is not None:
+            return data
+        try:
+            data = self._path(name).read_bytes()
+        except FileNotFoundError:
+            return None
+        if remember:
+            self._remember(name, data)
+        return data
+
+    def _write(self, name: str, data: bytes):
+        """Write an image unless a file sharing it already did."""
+        path = self._path(name)
+        if path.exists():
+            return
+        path.parent.mkdir(exist_ok=True)
+        # Written aside and renamed, so readers never see a partial image
+        fd, tmp = tempfile.mkstemp(dir=path.parent)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _remember_version(self, key: tuple, version: tuple):
+        with self.lock:
+            self.versions[key] = tuple(version)
+            self.versions.move_to_end(key)
+            while len(self.versions) > self.MAX_VERSIONS:
+                self.versions.popitem(last=False)
+
+    def _remember(self, name: str, data: bytes):
+        with self.lock:
+            if name in self.images or len(data) > self.max_bytes:
+                return
+            self.images[name] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self.images.popitem(last=False)
+                self.size -= len(evicted)
+
+
+def _image_name(digest: str, mime: Optional[str], size: Optional[int]) -> tuple:
+    """File name and type of an image, or of its ``size`` thumbnail."""
+    if size is None:
+        return digest, mime
+    fmt = settings.thumbnail_format
+    return f"{digest}-{size}.{fmt}", f"image/{fmt}"
+
+
+def render_thumbnails(data: bytes, sizes: list) -> dict:
+    """Scale an image to fit each of ``sizes``, largest first from one decode."""
+    with Image.open(io.BytesIO(data)) as image:
+        # Lets JPEG decode straight to a fraction of its size
+        image.draft("RGB", (max(sizes), max(sizes)))
+        image = image.convert("RGB")
+
+    thumbnails = {}
+    for size in sorted(sizes, reverse=True):
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, format=settings.thumbnail_format.upper(), quality=85)
+        thumbnails[size] = out.getvalue()
+    return thumbnails
+
+
+def read_image(full_path: Path) -> tuple:
+    """Read a folder image as ``(data, mime)``."""
+    mime = mimetypes.guess_type(full_path.name)[0] or "image/jpeg"
+    return full_path.read_bytes(), mime
+
+
+def extract_embedded_art(full_path: Path) -> Optional[tuple]:
+    """Read the first embedded picture of an audio file as ``(data, mime)``."""
+    audio = mutagen.File(full_path)
+
+    # Try different tag formats for embedded art
+    art_data = None
+    mime_type = "image/jpeg"
+
+    if hasattr(audio, "pictures") and audio.pictures:
+        # FLAC, OGG
+        art_data = audio.pictures[0].data
+        mime_type = audio.pictures[0].mime
+
+    elif hasattr(audio, "tags"):
+        tags = audio.tags
+
+        # ID3 (MP3)
+        if hasattr(tags, "getall"):
+            apic_frames = tags.getall("APIC")
+            if apic_frames:
+                art_data = apic_frames[0].data
+                mime_type = apic_frames[0].mime
+
+        # MP4/M4A
+        elif "covr" in tags:
+            covers = tags["covr"]
+            if covers:
+                art_data = bytes(covers[0])
+                # MP4 cover format
+                if hasattr(covers[0], "imageformat"):
+                    fmt = covers[0].imageformat
+                    if fmt == 13:  # JPEG
+                        mime_type = "image/jpeg"
+                    elif fmt == 14:  # PNG
+                        mime_type = "image/png"
+
+    if not art_data:
+        return None
+    return art_data, mime_type
+
+
+_cache: Optional[ArtCache] = None
+
+
+def get_art_cache() -> ArtCache:
+    """The art cache under the data path, opened on first use."""
+    global _cache
+    if _cache is None:
+        _cache = ArtCache(Path(settings.data_path) / "art", settings.art_cache_mb * 1024 * 1024)
+    return _cache
+
+
+def schedule_thumbnails(changes=None):
+    """Render missing thumbnails in the background after the library changed.
+
+    ``changes`` from the watcher limit the run to the covers of the artists
+    they touched. Without them every cover is checked and unused art is
+    swept from the cache.
+    """
+    _renderer.schedule(changes)
+
+
+async def _render(changes: Optional[list]):
+    if changes is None:
+        await render_missing_thumbnails()
+    else:
+        await render_missing_thumbnails(set().union(*(c.artists for c in changes)))
+
+
+async def render_missing_thumbnails(artists: Optional[set] = None, chunk_size: int = 500):
+    """Render the thumbnails of the covers shown by the browse lists.
+
+    With ``artists`` only the covers of those artists and their albums are
+    rendered. Otherwise every cover is, and the art cache files no library
+    file uses any more are deleted afterwards.
+    """
+    started = time.perf_counter()
+    columns = (
+        Track.file_path, Track.file_size, Track.last_modified,
+        Track.has_embedded_art, Track.folder_art_path,
+    )
+    rows = []
+    async with read_session() as session:
+        if artists is None:
+            art_tracks = union(select(Album.art_track_id), select(Artist.art_track_id))
+            rows = (await session.execute(select(*columns).where(Track.id.in_(art_tracks)))).all()
+        else:
+            names = list(artists)
+            for i in range(0, len(names), chunk_size):
+                chunk = names[i:i + chunk_size]
+                art_tracks = union(
+                    select(Album.art_track_id).where(artist_in(Album.artist, chunk)),
+                    select(Artist.art_track_id).where(artist_in(Artist.name, chunk)),
+                )
+                rows += (await session.execute(
+                    select(*columns).where(Track.id.in_(art_tracks))
+                )).all()
+
+    cache = get_art_cache()
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=max(1, settings.thumbnail_workers)) as pool:
+        await asyncio.gather(*(
+            loop.run_in_executor(pool, _prerender, cache, row) for row in rows
+        ))
+
+    if artists is not None:
+        print(
+            f"Thumbnails checked for {len(rows)} changed covers "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+        return
+
+    # Drop the art of files that changed or left the library
+    async with read_session() as session:
+        embedded = await session.execute(select(Track.file_path).where(Track.has_embedded_art))
+        folders = await session.execute(
+            select(Track.folder_art_path).where(Track.folder_art_path.isnot(None)).distinct()
+        )
+        paths = set(embedded.scalars()) | set(folders.scalars())
+    deleted = await asyncio.to_thread(cache.sweep, paths)
+
+    print(
+        f"Thumbnails checked for {len(rows)} covers "
+        f"in {time.perf_counter() - started:.1f}s, {deleted} unused art files deleted"
+    )
+
+
+def _prerender(cache: ArtCache, row):
+    """Render the thumbnails of one track's art, as its art URL picks it."""
+    music_path = Path(settings.music_path)
+    try:
+        if row.has_embedded_art:
+            key = (row.file_path, row.file_size or 0, file_version(row.last_modified))
+            cache.prerender(key, music_path / row.file_path)
+        elif row.folder_art_path:
+            full_path = music_path / row.folder_art_path
+            stat = full_path.stat()
+            key = (row.folder_art_path, stat.st_size, stat.st_mtime_ns // 1000)
+            cache.prerender(key, full_path, read_image)
+    except Exception as e:
+        print(f"Error rendering thumbnails for {row.file_path}: {e}")
+
+
+# Background rendering of the thumbnails of album and artist covers
+_renderer = BackgroundJob(_render, "rendering thumbnails")
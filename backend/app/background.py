@@ -0,0 +1,41 @@
+import asyncio
+from typing import Optional
+
+
+class BackgroundJob:
+    """Runs ``job`` in a background task, one run at a time.
+
+    Work scheduled while a run is going is folded into one more run. Each
+    run is passed the changes scheduled since the last one, or None if a
+    full run was asked for, which covers any changes scheduled with it.
+    """
+
+    def __init__(self, job, description: str):
+        self.job = job
+        self.description = description
+        self.task: Optional[asyncio.Task] = None
+        self.pending = False
+        self.full = False
+        self.changes = []
+
+    def schedule(self, changes=None):
+        """Run the job for ``changes``, or in full when None."""
+        if changes is None:
+            self.full = True
+        else:
+            self.changes.append(changes)
+        self.pending = True
+        if self.task and not self.task.done():
+            return
+        self.task = asyncio.create_task(self._run_until_current())
+
+    async def _run_until_current(self):
+        while self.pending:
+            changes = None if self.full else self.changes
+            self.pending = False
+            self.full = False
+            self.changes = []
+            try:
+                await self.job(changes)
+            except Exception as e:
+                print(f"Error {self.description}: {e}")
@@ -13,9 +13,32 @@ class Settings(BaseSettings):
 
     # Database
     database_url: str = ""
+    db_read_connections: int = 4  # Read-only connections for API queries
+    db_cache_size_mb: int = 64  # SQLite page cache per connection
+    db_mmap_size_mb: int = 256  # Memory-mapped I/O window, 0 to disable
+    db_busy_timeout_ms: int = 5000  # How long to wait for a lock before failing
 
     # Indexing
     index_on_startup: bool = True
+    index_workers: int = 0  # Tag parser workers, 0 = one per CPU
+    index_executor: str = "process"  # process or thread
+    index_batch_size: int = 500  # Tracks per bulk upsert
+    tag_cache: bool = True  # Reuse parsed tags of unchanged files across rebuilds
+
+    # API responses
+    response_cache_mb: int = 32  # Memory for cached browse responses, 0 to disable
+    art_cache_mb: int = 32  # Memory for extracted art and thumbnails, 0 to keep them on disk only
+    thumbnail_format: str = "jpeg"  # jpeg or webp
+    thumbnail_workers: int = 1  # Threads rendering thumbnails in the background
+
+    # Search
+    fuzzy_search_budget_ms: int = 20  # Time limit for typo-tolerant matching
+
+    # Live library updates
+    watch_library: bool = False
+    watch_force_polling: bool = False  # For shares that don't deliver inotify events
+    watch_poll_interval_ms: int = 30000
+    watch_debounce_ms: int = 2000
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,238 @@
+import asyncio
+import heapq
+import re
+import time
+import unicodedata
+from array import array
+from collections import Counter, defaultdict
+from itertools import islice
+from typing import Optional
+
+from sqlalchemy import select
+
+from .background import BackgroundJob
+from .config import settings
+from .models import Track, Artist, Album, artist_in, read_session
+
+
+class TrigramIndex:
+    """In-memory trigram index over artist, album and track names.
+
+    Each entry is a ``(kind, text, value)`` tuple, where ``value`` is what a
+    match returns: the artist name, ``(album, artist)`` or the track ID.
+    Matches are ranked by the share of the query's trigrams found in the
+    name, then by overall similarity, so misspellings like "beatels" still
+    find "The Beatles".
+
+    Entries can be added and removed in place. Removed entries stay in the
+    posting lists, marked dead, until the index is rebuilt.
+    """
+
+    # Candidates scored per search
+    MAX_CANDIDATES = 5000
+
+    def __init__(self, entries: list):
+        postings = defaultdict(list)
+        self.kinds = []
+        self.values = []
+        self.sizes = array("I")
+        self.entry_ids = {}  # (kind, value) -> entry ID of live entries
+        self.albums = defaultdict(set)  # artist -> (kind, value) of their albums
+        self.dead = 0
+
+        for entry_id, (kind, name, value) in enumerate(entries):
+            grams = trigrams(name)
+            for gram in grams:
+                postings[gram].append(entry_id)
+            self._append(kind, value, grams)
+
+        self.postings = {gram: array("I", ids) for gram, ids in postings.items()}
+
+    def __len__(self):
+        return len(self.entry_ids)
+
+    def add(self, entries: list, grams: list):
+        """Add ``entries`` with their precomputed ``trigrams``, replacing
+        any live entries with the same kind and value."""
+        self.remove((kind, value) for kind, _, value in entries)
+        empty = array("I")
+        for (kind, _, value), entry_grams in zip(entries, grams):
+            entry_id = len(self.values)
+            for gram in entry_grams:
+                self.postings.setdefault(gram, empty[:]).append(entry_id)
+            self._append(kind, value, entry_grams)
+
+    def remove(self, keys):
+        """Remove the entries of ``(kind, value)`` keys, if present."""
+        for key in keys:
+            entry_id = self.entry_ids.pop(key, None)
+            if entry_id is None:
+                continue
+            if key[0] == "album":
+                self.albums[key[1][1]].discard(key)
+            self.kinds[entry_id] = None
+            self.dead += 1
+
+    def _append(self, kind: str, value, grams: set):
+        key = (kind, value)
+        self.entry_ids[key] = len(self.values)
+        if kind == "album":
+            self.albums[value[1]].add(key)
+        self.kinds.append(kind)
+        self.values.append(value)
+        self.sizes.append(len(grams))
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        budget_ms: float = 20,
+        min_similarity: float = 0.5,
+    ) -> dict:
+        """Find approximate matches, returning ``{kind: [value, ...]}``.
+
+        Posting lists are merged rarest first. Once ``budget_ms`` is spent the
+        remaining, most common trigrams are skipped, which costs some recall
+        on very short or very common queries but bounds the latency.
+        """
+        grams = trigrams(query)
+        if not grams:
+            return {}
+
+        deadline = time.perf_counter() + budget_ms / 1000
+        hits = Counter()
+        empty = array("I")
+        for gram in sorted(grams, key=lambda g: len(self.postings.get(g, empty))):
+            hits.update(self.postings.get(gram, empty))
+            if time.perf_counter() > deadline:
+                break
+        candidates = hits.items()
+        if len(hits) > self.MAX_CANDIDATES:
+            # Entries sharing the rarest trigrams were counted first
+            candidates = islice(candidates, self.MAX_CANDIDATES)
+
+        query_size = len(grams)
+        min_hits = max(1, int(query_size * min_similarity + 0.5))
+        by_kind = defaultdict(list)
+        for entry_id, count in candidates:
+            if count >= min_hits and self.kinds[entry_id] is not None:
+                overlap = count / query_size
+                similarity = count / (query_size + self.sizes[entry_id] - count)
+                by_kind[self.kinds[entry_id]].append((overlap, similarity, entry_id))
+
+        return {
+            kind: [self.values[entry_id] for _, _, entry_id in heapq.nlargest(limit, scored)]
+            for kind, scored in by_kind.items()
+        }
+
+
+def trigrams(text: str) -> set:
+    """Trigrams of each word, lowercased and without diacritics.
+
+    Words are padded like ``"  word "`` so their starts weigh more than
+    their ends, as in PostgreSQL's pg_trgm.
+    """
+    normalized = unicodedata.normalize("NFKD", text.lower())
+    stripped = "".join(c for c in normalized if not unicodedata.combining(c))
+    grams = set()
+    for word in re.findall(r"\w+", stripped):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+# The live index. Rebuilds replace it whole, so searches never see one
+# half-built.
+_index: Optional[TrigramIndex] = None
+
+
+def search(query: str, limit: int = 20) -> dict:
+    """Fuzzy matches from the current index, or none while it is first built."""
+    index = _index
+    if index is None:
+        return {}
+    return index.search(query, limit=limit, budget_ms=settings.fuzzy_search_budget_ms)
+
+
+def schedule_rebuild(changes=None):
+    """Update the index in the background after the library changed.
+
+    ``changes`` from the watcher patch just the entries they touched;
+    without them the index is rebuilt. Requests arriving while an update
+    runs are folded into one more update.
+    """
+    _rebuilder.schedule(changes)
+
+
+async def _update(changes: Optional[list]):
+    index = _index
+    # Rebuild rather than patch once dead entries crowd the posting lists
+    if changes is None or index is None or index.dead > len(index) // 4:
+        await rebuild()
+    else:
+        await patch(index, changes)
+
+
+async def rebuild():
+    """Build a new index from the library and swap it in."""
+    global _index
+    started = time.perf_counter()
+
+    async with read_session() as session:
+        artists = (await session.execute(select(Artist.name))).scalars().all()
+        albums = (
+            await session.execute(
+                select(Album.name, Album.artist).where(Album.name.isnot(None)).distinct()
+            )
+        ).all()
+        tracks = (await session.execute(select(Track.id, Track.title))).all()
+
+    entries = [("artist", name, name) for name in artists]
+    entries += [("album", name, (name, artist)) for name, artist in albums]
+    entries += [("track", title, track_id) for track_id, title in tracks]
+
+    _index = await asyncio.to_thread(TrigramIndex, entries)
+    print(
+        f"Fuzzy search index built: {len(_index)} names "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+
+
+async def patch(index: TrigramIndex, changes: list, chunk_size: int = 500):
+    """Update the entries of the tracks and artists in watcher ``changes``."""
+    started = time.perf_counter()
+    track_ids = list(set().union(*(c.track_ids | c.removed_ids for c in changes)))
+    artists = list(set().union(*(c.artists for c in changes)))
+
+    entries = []
+    async with read_session() as session:
+        for i in range(0, len(track_ids), chunk_size):
+            result = await session.execute(
+                select(Track.id, Track.title).where(Track.id.in_(track_ids[i:i + chunk_size]))
+            )
+            entries += [("track", title, track_id) for track_id, title in result]
+        for i in range(0, len(artists), chunk_size):
+            chunk = artists[i:i + chunk_size]
+            result = await session.execute(select(Artist.name).where(artist_in(Artist.name, chunk)))
+            entries += [("artist", name, name) for name in result.scalars()]
+            result = await session.execute(
+                select(Album.name, Album.artist)
+                .where(Album.name.isnot(None), artist_in(Album.artist, chunk))
+                .distinct()
+            )
+            entries += [("album", name, (name, artist)) for name, artist in result]
+
+    grams = await asyncio.to_thread(lambda: [trigrams(name) for _, name, _ in entries])
+
+    # Applied on the event loop, which runs the searches, in one step
+    index.remove(("track", track_id) for track_id in track_ids)
+    index.remove(("artist", name) for name in artists)
+    index.remove([key for name in artists for key in index.albums.pop(name, ())])
+    index.add(entries, grams)
+    print(
+        f"Fuzzy search index patched: {len(entries)} names "
+        f"in {time.perf_counter() - started:.2f}s"
+    )
+
+
+_rebuilder = BackgroundJob(_update, "updating fuzzy search index")
@@ -0,0 +1,106 @@
+import time
+import zlib
+from typing import Optional
+
+from fastapi import HTTPException, Request, Response
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+from .models import LibraryState, async_session
+
+# The generation clients last saw, published only after its changes are
+# committed so an ETag never names data a reader can't see yet
+_current: Optional[int] = None
+
+
+def current() -> Optional[int]:
+    """The current library generation, or None before it is loaded."""
+    return _current
+
+
+async def load():
+    """Load the generation at startup, creating the state row if needed.
+
+    A new database starts from the current time rather than zero, so its
+    generations never repeat those of a database it replaced.
+    """
+    global _current
+    async with async_session() as session:
+        result = await session.execute(select(LibraryState.generation))
+        generation = result.scalar_one_or_none()
+        if generation is None:
+            generation = _initial()
+            session.add(LibraryState(id=1, generation=generation))
+            await session.commit()
+    _current = generation
+
+
+async def bump(session: AsyncSession) -> int:
+    """Commit the session's changes together with a new generation.
+
+    Call this in place of ``session.commit()`` after changing anything the
+    library or playlist endpoints return.
+    """
+    global _current
+    result = await session.execute(
+        update(LibraryState).values(generation=LibraryState.generation + 1)
+    )
+    if result.rowcount == 0:
+        session.add(LibraryState(id=1, generation=_initial()))
+        await session.flush()
+    result = await session.execute(select(LibraryState.generation))
+    generation = result.scalar_one()
+    await session.commit()
+    _current = generation
+    return generation
+
+
+def _initial() -> int:
+    """Starting generation of a new database."""
+    return int(time.time())
+
+
+def etag(generation: Optional[int] = None) -> Optional[str]:
+    """ETag of library responses at ``generation``, by default the current one.
+
+    The stream base URL is part of the tag since it is embedded in response
+    bodies and changes with the configured host.
+    """
+    if generation is None:
+        generation = _current
+    if generation is None:
+        return None
+    host = zlib.crc32(settings.stream_base_url.encode())
+    return f'"{generation}-{host:x}"'
+
+
+def cache_headers(generation: Optional[int] = None) -> dict:
+    """Headers letting clients revalidate library responses by ETag."""
+    tag = etag(generation)
+    if tag is None:
+        return {}
+    return {"ETag": tag, "Cache-Control": "no-cache"}
+
+
+async def conditional_get(request: Request, response: Response):
+    """Route dependency answering ``If-None-Match`` from the generation.
+
+    A match is answered with 304 before the endpoint runs any query.
+    Otherwise the ETag is added to the endpoint's response.
+    """
+    headers = cache_headers()
+    if not headers:
+        return
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, headers["ETag"]):
+        raise HTTPException(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+
+
+def etag_matches(if_none_match: str, tag: str) -> bool:
+    """Whether an ``If-None-Match`` header names ``tag``, compared weakly."""
+    candidates = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    return tag in candidates or "*" in candidates
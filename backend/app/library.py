@@ -1,354 +1,952 @@
 import asyncio
+import functools
+import multiprocessing
 import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import NamedTuple, Optional
 
-import mutagen
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, insert, update, and_, case, func, literal_column, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from . import art_cache, fuzzy_search, generation
 from .config import settings
-from .models import Track, Playlist, PlaylistEntry, IndexStatus, async_session
+from .models import (
+    Track, Artist, Album, Playlist, PlaylistEntry, IndexStatus, IndexCheckpoint, LibraryState,
+    PENDING_GENERATION, artist_in, async_session, read_session,
+)
+from .tag_cache import TagCache
+from .tags import file_fingerprint, read_tags, track_values
 
 # Supported audio formats
 AUDIO_EXTENSIONS = {".mp3", ".m4a", ".wav", ".flac"}
 PLAYLIST_EXTENSIONS = {".m3u", ".m3u8"}
 ART_FILENAMES = {"folder.jpg", "Folder.jpg", "cover.jpg", "Cover.jpg", "folder.png", "cover.png"}
 
+# Serializes index runs and live watcher updates
+index_lock = asyncio.Lock()
 
-async def start_background_index(force: bool = False):
-    """Start background indexing of the music library."""
-    async with async_session() as session:
-        # Check if already running
-        result = await session.execute(
-            select(IndexStatus)
-            .where(IndexStatus.status == "running")
-            .limit(1)
-        )
-        if result.scalar_one_or_none() and not force:
-            print("Indexing already in progress")
-            return
-
-        # Create new status record
-        status = IndexStatus(
-            status="running",
-            started_at=datetime.utcnow(),
-            total_files=0,
-            processed_files=0,
-        )
-        session.add(status)
+
+async def start_background_index(force: bool = False, full: bool = False):
+    """Start background indexing of the music library.
+
+    By default only new or changed files are re-parsed; pass ``full=True``
+    to re-read the tags of every file. A run interrupted by a restart is
+    resumed from its checkpoints.
+    """
+    if index_lock.locked() and not force:
+        print("Indexing already in progress")
+        return
+
+    async with index_lock, async_session() as session:
+        status = await recover_interrupted_index(session, resume=True, full=full)
+
+        if status is None:
+            # Create new status record
+            status = IndexStatus(
+                status="running",
+                started_at=datetime.utcnow(),
+                total_files=0,
+                processed_files=0,
+                full_scan=full,
+            )
+            session.add(status)
         await session.commit()
         await session.refresh(status)
 
         try:
-            await index_library(session, status)
+            await index_library(session, status, full=bool(status.full_scan))
             status.status = "completed"
             status.completed_at = datetime.utcnow()
+            fuzzy_search.schedule_rebuild()
+            art_cache.schedule_thumbnails()
+        except asyncio.CancelledError:
+            # Cut short by a shutdown: the run stays ``running`` with its
+            # checkpoints, and the next start resumes it
+            print("Indexing cancelled, will resume on next start")
+            raise
         except Exception as e:
+            # A failed write leaves the session needing a rollback
+            await session.rollback()
+            await session.refresh(status)
             status.status = "error"
             status.error_message = str(e)
             print(f"Indexing error: {e}")
-        finally:
-            await session.commit()
 
+        await session.execute(
+            delete(IndexCheckpoint).where(IndexCheckpoint.run_id == status.id)
+        )
+        await generation.bump(session)
+
+
+async def recover_interrupted_index(
+    session: AsyncSession, resume: bool = False, full: bool = False
+) -> Optional[IndexStatus]:
+    """Recover index runs left ``running`` by a process that stopped mid-run.
+
+    Runs in this process are serialized by ``index_lock``, so while it is
+    held any ``running`` row is stale. With ``resume`` the latest stale run
+    is returned so it can continue from its checkpoints (unless a full scan
+    was requested and the stale run was incremental); the rest are marked
+    ``interrupted``.
+    """
+    result = await session.execute(
+        select(IndexStatus)
+        .where(IndexStatus.status == "running")
+        .order_by(IndexStatus.id.desc())
+    )
+    resumed = None
+
+    for run in result.scalars():
+        if resume and resumed is None and (run.full_scan or not full):
+            resumed = run
+            print(f"Resuming interrupted index run {run.id}")
+            continue
 
-async def index_library(session: AsyncSession, status: IndexStatus):
-    """Index all music files in the library."""
+        run.status = "interrupted"
+        run.completed_at = datetime.utcnow()
+        await session.execute(
+            delete(IndexCheckpoint).where(IndexCheckpoint.run_id == run.id)
+        )
+
+    await session.commit()
+    return resumed
+
+
+async def index_library(session: AsyncSession, status: IndexStatus, full: bool = False):
+    """Index all music files in the library.
+
+    Files are compared against the tracks table by path, size and mtime so
+    that only new or changed files are parsed. Existing rows are updated in
+    place to keep track IDs stable, and rows for vanished files are removed.
+
+    Tracks whose files vanished are matched by content fingerprint to new
+    files, so renamed or moved tracks keep their IDs.
+
+    The browse tables are rebuilt once at the end. A first index also fills
+    them for each written batch, publishing a new generation each time.
+
+    Each directory is checkpointed in the same commit as its last tracks.
+    When the run is resumed, checkpointed directories are listed for
+    subdirectories and playlists only, without stat-ing or parsing files.
+    """
     music_path = Path(settings.music_path)
 
     if not music_path.exists():
         raise Exception(f"Music path does not exist: {music_path}")
 
-    # Count total files first
-    print("Counting files...")
-    status.error_message = "Counting Files..."
-    total_files = 0
-    for root, dirs, files in os.walk(music_path):
-        for f in files:
-            ext = Path(f).suffix.lower()
-            if ext in AUDIO_EXTENSIONS or ext in PLAYLIST_EXTENSIONS:
-                total_files += 1
-                if total_files % 100 == 0:
-                    status.total_files = total_files
-
-    status.total_files = total_files
-    await session.commit()
-    print(f"Found {total_files} files to index")
+    result = await session.execute(
+        select(IndexCheckpoint.directory).where(IndexCheckpoint.run_id == status.id)
+    )
+    done_dirs = set(result.scalars())
+    if done_dirs:
+        print(f"Skipping {len(done_dirs)} directories indexed before the restart")
+
+    # Snapshot what is already indexed so unchanged files can be skipped
+    result = await session.execute(
+        select(
+            Track.id, Track.file_path, Track.file_size, Track.last_modified, Track.fingerprint,
+            Track.folder_art_path,
+        )
+    )
+    existing = {row.file_path: row for row in result}
+    seen_paths = set()
+
+    # Until a run has built the browse tables, fill them in as tracks are
+    # written, so a first index is browsable long before it finishes
+    fill_browse = not await _has_browse_rows(session)
 
-    # Clear existing data if force reindex
-    await session.execute(delete(Track))
-    await session.execute(delete(PlaylistEntry))
-    await session.execute(delete(Playlist).where(Playlist.is_user_created == False))
+    # Release the writer connection while the first batch is being parsed
     await session.commit()
 
-    # Index files
+    # Index files: the walk feeds a pool of tag parsers, and parsed results
+    # come back here to be written by this single coroutine
+    status.total_files = 0
     processed = 0
-    batch_size = 100
+    last_reported = 0
+    skipped = 0
+    written = 0
+    art_updated = 0
+    write_seconds = 0.0
+    cache_hits = 0
+    batch_size = settings.index_batch_size
     tracks_batch = []
+    cache_batch = []
+    fingerprint_batch = []
+    art_batch = []
     playlists_to_process = []
 
-    for root, dirs, files in os.walk(music_path):
-        root_path = Path(root)
-        rel_root = root_path.relative_to(music_path)
-
-        # Check for folder art
-        folder_art = None
-        for art_name in ART_FILENAMES:
-            art_path = root_path / art_name
-            if art_path.exists():
-                folder_art = str(rel_root / art_name)
-                break
+    # Outstanding parses per directory, and directories ready to checkpoint
+    dir_pending = {}
+    walked_dirs = set()
+    completed_dirs = []
+
+    loop = asyncio.get_running_loop()
+    executor = _create_parse_executor()
+    tag_cache = _open_tag_cache()
+    max_pending = _parse_worker_count() * 4
+    pending = {}
+
+    def on_parsed(rel_path, rel_dir, folder_art, file_size, mtime, cache_key, tags):
+        if tags:
+            tracks_batch.append(track_values(tags, rel_path, folder_art, file_size, mtime))
+            cache_batch.append((cache_key, tags))
+            seen_paths.add(rel_path)
+        elif rel_path in existing:
+            # A known file that fails to parse, say while a tagger rewrites
+            # it or the NAS hiccups, keeps its row and ID until it parses again
+            seen_paths.add(rel_path)
+
+        dir_pending[rel_dir] -= 1
+        if not dir_pending[rel_dir] and rel_dir in walked_dirs:
+            completed_dirs.append(rel_dir)
+
+    def on_fingerprint(track_id, fingerprint):
+        fingerprint_batch.append({"id": track_id, "fingerprint": fingerprint})
+
+    def collect(done):
+        for future in done:
+            handler = pending.pop(future)
+            try:
+                handler(future.result())
+            except OSError as e:
+                print(f"Error fingerprinting file: {e}")
+
+    async def flush():
+        nonlocal tracks_batch, cache_batch, fingerprint_batch, art_batch, completed_dirs
+        nonlocal written, art_updated, write_seconds
+        if tag_cache:
+            tag_cache.put_many(cache_batch)
+        cache_batch = []
+
+        started = time.perf_counter()
+        if tracks_batch:
+            await _write_tracks(session, tracks_batch)
+        if fingerprint_batch:
+            await session.execute(update(Track), fingerprint_batch)
+            fingerprint_batch = []
+        if art_batch:
+            await session.execute(update(Track), art_batch)
+            art_updated += len(art_batch)
+            art_batch = []
+        if completed_dirs:
+            await session.execute(
+                insert(IndexCheckpoint),
+                [{"run_id": status.id, "directory": d} for d in completed_dirs],
+            )
+        if fill_browse and tracks_batch:
+            await refresh_browse_tables(session, artists={t["artist"] for t in tracks_batch})
+            await generation.bump(session)
+        else:
+            await session.commit()
+        write_seconds += time.perf_counter() - started
+        written += len(tracks_batch)
+        tracks_batch = []
+        completed_dirs = []
 
-        for filename in files:
-            file_path = root_path / filename
-            rel_path = str(rel_root / filename)
-            ext = Path(filename).suffix.lower()
+    try:
+        async for dir_path, rel_root, folder_art, files in _scan_library(music_path, done_dirs=done_dirs):
+            rel_dir = str(rel_root)
+            resumed = rel_dir in done_dirs
+
+            # Files are counted as they are discovered
+            status.total_files += len(files)
+            to_parse = []
+
+            for filename, ext, file_size, mtime, cache_key in files:
+                file_path = dir_path / filename
+                rel_path = str(rel_root / filename)
+
+                if ext in AUDIO_EXTENSIONS:
+                    known = existing.get(rel_path)
+                    if resumed or (known and not full and _is_unchanged(known, file_size, mtime)):
+                        seen_paths.add(rel_path)
+                        skipped += 1
+
+                        # Folder art is added or removed without touching the track
+                        if known and known.folder_art_path != folder_art:
+                            art_batch.append({
+                                "id": known.id,
+                                "has_folder_art": folder_art is not None,
+                                "folder_art_path": folder_art,
+                            })
+
+                        # Rows indexed before fingerprints existed get one now
+                        if known and known.fingerprint is None and not resumed:
+                            future = loop.run_in_executor(executor, file_fingerprint, str(file_path))
+                            pending[future] = functools.partial(on_fingerprint, known.id)
+                    else:
+                        to_parse.append((str(file_path), rel_path, file_size, mtime, cache_key))
+
+                elif ext in PLAYLIST_EXTENSIONS:
+                    playlists_to_process.append((file_path, rel_path))
+
+                processed += 1
+                status.processed_files = processed
+
+            # Files whose bytes haven't changed come from the tag cache
+            cached = {}
+            if tag_cache and to_parse:
+                cached = tag_cache.get_many([item[4] for item in to_parse])
+
+            for path, rel_path, file_size, mtime, cache_key in to_parse:
+                tags = cached.get(cache_key)
+                if tags is not None:
+                    tracks_batch.append(track_values(tags, rel_path, folder_art, file_size, mtime))
+                    seen_paths.add(rel_path)
+                    cache_hits += 1
+                else:
+                    future = loop.run_in_executor(executor, read_tags, path)
+                    pending[future] = functools.partial(
+                        on_parsed, rel_path, rel_dir, folder_art, file_size, mtime, cache_key
+                    )
+                    dir_pending[rel_dir] = dir_pending.get(rel_dir, 0) + 1
+
+                # Bound the work in flight so memory stays flat
+                if len(pending) >= max_pending:
+                    done, _ = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    collect(done)
+
+                # Commit in batches
+                if len(tracks_batch) >= batch_size:
+                    await flush()
+                    last_reported = processed
+                    print(f"Indexed {processed}/{status.total_files} files...")
+
+            if not resumed:
+                walked_dirs.add(rel_dir)
+                if not dir_pending.get(rel_dir):
+                    completed_dirs.append(rel_dir)
+
+            # Keep progress and checkpoints current even when nothing needs writing
+            if processed - last_reported >= batch_size:
+                await flush()
+                last_reported = processed
+
+        if pending:
+            done, _ = await asyncio.wait(pending)
+            collect(done)
+
+        # Commit remaining tracks
+        await flush()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        if tag_cache:
+            tag_cache.close()
+
+    # Drop tracks whose files have vanished, unless they were renamed or moved
+    removed = [row for path, row in existing.items() if path not in seen_paths]
+    new_paths = [path for path in seen_paths if path not in existing]
+    kept_ids = await _preserve_moved_tracks(session, removed, new_paths)
+    removed_ids = [row.id for row in removed if row.id not in kept_ids]
+    await _remove_tracks(session, removed_ids)
+
+    # Rebuild the browse tables once per run, rather than per written batch.
+    # A resumed run may follow writes whose rebuild never happened.
+    if (
+        written or art_updated or removed_ids or kept_ids or done_dirs
+        or not await _has_browse_rows(session)
+    ):
+        await refresh_browse_tables(session)
+        await session.commit()
 
-            if ext in AUDIO_EXTENSIONS:
-                track = await process_audio_file(file_path, rel_path, folder_art)
-                if track:
-                    tracks_batch.append(track)
+    # Process playlists after tracks are indexed
+    result = await session.execute(
+        select(Playlist).where(Playlist.is_user_created == False)
+    )
+    imported = {p.file_path: p for p in result.scalars()}
 
-            elif ext in PLAYLIST_EXTENSIONS:
-                playlists_to_process.append((file_path, rel_path))
+    # Resolve every playlist against one path -> id map
+    track_ids = {}
+    if playlists_to_process:
+        result = await session.execute(select(Track.file_path, Track.id))
+        track_ids = dict(result.all())
 
-            processed += 1
-            status.processed_files = processed
+    for playlist_path, rel_path in playlists_to_process:
+        await process_playlist_file(
+            session,
+            playlist_path,
+            rel_path,
+            playlist=imported.pop(rel_path, None),
+            track_ids=track_ids,
+        )
 
-            # Commit in batches
-            if len(tracks_batch) >= batch_size:
-                session.add_all(tracks_batch)
-                await session.commit()
-                tracks_batch = []
-                print(f"Indexed {processed}/{total_files} files...")
+    # Imported playlists whose M3U file is gone
+    for playlist in imported.values():
+        await session.delete(playlist)
+    await session.commit()
 
-    # Commit remaining tracks
-    if tracks_batch:
-        session.add_all(tracks_batch)
-        await session.commit()
+    print(
+        f"Indexing complete: {processed} files processed, "
+        f"{skipped} unchanged, {cache_hits} from tag cache, {len(kept_ids)} moved, "
+        f"{len(removed_ids)} removed"
+    )
+    if written:
+        print(f"Wrote {written} tracks at {written / max(write_seconds, 1e-6):.0f} rows/sec")
+
+
+def _parse_worker_count() -> int:
+    """Number of tag parser workers to run."""
+    return settings.index_workers or os.cpu_count() or 1
+
+
+def _create_parse_executor() -> Executor:
+    """Create the executor that runs tag parsing off the event loop."""
+    workers = _parse_worker_count()
+    if settings.index_executor == "thread":
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tag-parser")
+
+    # Spawn rather than fork: the server process has live aiosqlite threads
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+async def _scan_library(
+    music_path: Path, start: Optional[Path] = None, done_dirs: frozenset = frozenset()
+):
+    """Walk the library in a single pass, one directory at a time.
+
+    Yields ``(dir_path, rel_root, folder_art, files)`` where ``files`` lists
+    ``(filename, ext, file_size, mtime, cache_key)`` for audio and playlist
+    files.
+    Directory listings run in a thread so slow network storage doesn't block
+    the event loop. ``start`` limits the walk to one subdirectory, and files
+    in ``done_dirs`` are listed without being stat-ed.
+    """
+    stack = [start or music_path]
+    while stack:
+        dir_path = stack.pop()
+        rel_root = dir_path.relative_to(music_path)
+        subdirs, art_name, files = await asyncio.to_thread(
+            _scan_directory, dir_path, str(rel_root) not in done_dirs
+        )
+        stack.extend(reversed(subdirs))
 
-    # Process playlists after tracks are indexed
-    for playlist_path, rel_path in playlists_to_process:
-        await process_playlist_file(session, playlist_path, rel_path)
+        folder_art = str(rel_root / art_name) if art_name else None
+        yield dir_path, rel_root, folder_art, files
 
-    print(f"Indexing complete: {processed} files processed")
 
+def _scan_directory(dir_path: Path, stat_files: bool = True):
+    """List a directory once, returning its subdirectories, folder art and
+    the stat data of the files the indexer cares about."""
+    subdirs = []
+    names = set()
+    files = []
 
-async def process_audio_file(
-    file_path: Path, rel_path: str, folder_art: Optional[str]
-) -> Optional[Track]:
-    """Process a single audio file and extract metadata."""
     try:
-        stat = file_path.stat()
-        audio = mutagen.File(file_path)
-
-        if audio is None:
-            return None
-
-        # Extract metadata
-        title = None
-        artist = None
-        album = None
-        album_artist = None
-        track_number = None
-        disc_number = None
-        duration = None
-        year = None
-        genre = None
-        has_embedded_art = False
-
-        if audio:
-            duration = audio.info.length if hasattr(audio.info, "length") else None
-
-            tags = audio.tags if hasattr(audio, "tags") else audio
-
-            if tags:
-                # Try different tag formats
-                title = _get_tag(tags, ["TIT2", "title", "\xa9nam", "Title"])
-                artist = _get_tag(tags, ["TPE1", "artist", "\xa9ART", "Artist"])
-                album = _get_tag(tags, ["TALB", "album", "\xa9alb", "Album"])
-                album_artist = _get_tag(tags, ["TPE2", "albumartist", "aART"])
-                genre = _get_tag(tags, ["TCON", "genre", "\xa9gen", "Genre"])
-
-                # Track number
-                track_str = _get_tag(tags, ["TRCK", "tracknumber", "trkn"])
-                if track_str:
-                    if isinstance(track_str, tuple):
-                        track_number = track_str[0]
-                    elif "/" in str(track_str):
-                        track_number = int(str(track_str).split("/")[0])
-                    else:
-                        try:
-                            track_number = int(track_str)
-                        except (ValueError, TypeError):
-                            pass
-
-                # Disc number
-                disc_str = _get_tag(tags, ["TPOS", "discnumber", "disk"])
-                if disc_str:
-                    if isinstance(disc_str, tuple):
-                        disc_number = disc_str[0]
-                    elif "/" in str(disc_str):
-                        disc_number = int(str(disc_str).split("/")[0])
-                    else:
-                        try:
-                            disc_number = int(disc_str)
-                        except (ValueError, TypeError):
-                            pass
-
-                # Year
-                year_str = _get_tag(tags, ["TDRC", "date", "\xa9day", "Year"])
-                if year_str:
-                    try:
-                        year = int(str(year_str)[:4])
-                    except (ValueError, TypeError):
-                        pass
-
-                # Check for embedded art
-                has_embedded_art = _has_embedded_art(audio, tags)
-
-        # Fallback to path-based metadata
-        if not title:
-            title = file_path.stem
-
-        if not artist or not album:
-            path_parts = Path(rel_path).parts
-            if len(path_parts) >= 3:
-                # Artist/Album/Track structure
-                if not artist:
-                    artist = path_parts[-3]
-                if not album:
-                    album = path_parts[-2]
-            elif len(path_parts) >= 2:
-                # Artist/Track structure
-                if not artist:
-                    artist = path_parts[-2]
-
-        return Track(
-            file_path=rel_path,
-            title=title,
-            artist=artist,
-            album=album,
-            album_artist=album_artist,
-            track_number=track_number,
-            disc_number=disc_number,
-            duration=duration,
-            year=year,
-            genre=genre,
-            has_embedded_art=has_embedded_art,
-            has_folder_art=folder_art is not None,
-            folder_art_path=folder_art,
-            file_size=stat.st_size,
-            file_format=file_path.suffix.lower().lstrip("."),
-            last_modified=datetime.fromtimestamp(stat.st_mtime),
+        with os.scandir(dir_path) as entries:
+            for entry in sorted(entries, key=lambda e: e.name):
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(Path(entry.path))
+                        continue
+
+                    names.add(entry.name)
+                    ext = os.path.splitext(entry.name)[1].lower()
+                    if ext in AUDIO_EXTENSIONS or ext in PLAYLIST_EXTENSIONS:
+                        if stat_files:
+                            stat = entry.stat()
+                            cache_key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+                            files.append((entry.name, ext, stat.st_size, stat.st_mtime, cache_key))
+                        else:
+                            files.append((entry.name, ext, None, None, None))
+                except OSError as e:
+                    print(f"Error reading {entry.path}: {e}")
+    except OSError as e:
+        print(f"Error scanning {dir_path}: {e}")
+
+    art_name = min(names & ART_FILENAMES, default=None)
+    return subdirs, art_name, files
+
+
+def _open_tag_cache() -> Optional[TagCache]:
+    """Open the persistent tag cache, if enabled."""
+    if not settings.tag_cache:
+        return None
+    return TagCache(Path(settings.data_path) / "tagcache.db")
+
+
+def _is_unchanged(known, file_size: int, mtime: float) -> bool:
+    """Check whether a file still matches its indexed size and mtime."""
+    return (
+        known.file_size == file_size
+        and known.last_modified == datetime.fromtimestamp(mtime)
+    )
+
+
+async def _write_tracks(session: AsyncSession, tracks: list[dict]):
+    """Upsert parsed tracks in a single executemany.
+
+    Conflicts on ``file_path`` update the existing row, so known tracks keep
+    their IDs. The caller commits.
+    """
+    stmt = sqlite_insert(Track)
+    # The sync stamp is left to the update trigger, which only stamps rows
+    # whose stamp the statement didn't change
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Track.file_path],
+        set_={
+            column.name: stmt.excluded[column.name]
+            for column in Track.__table__.columns
+            if column.name not in ("id", "file_path", "sync_generation")
+        },
+    )
+    await session.execute(stmt, tracks)
+
+
+async def _preserve_moved_tracks(
+    session: AsyncSession, removed: list, new_paths: list, chunk_size: int = 500
+) -> set:
+    """Carry vanished tracks over to new files with the same content.
+
+    ``removed`` are rows (with ``id``, ``file_path`` and ``fingerprint``)
+    whose files are gone, and ``new_paths`` are paths first indexed in this
+    run. A vanished row whose fingerprint matches a new file takes over that
+    file's values in place and the new row is dropped, so playlist entries
+    and art URLs that use the track ID keep working. Returns the kept IDs.
+    """
+    by_fingerprint = {row.fingerprint: row for row in removed if row.fingerprint}
+    kept_ids = set()
+    if not by_fingerprint or not new_paths:
+        return kept_ids
+
+    table = Track.__table__
+    # The sync stamp is left to the update trigger, which marks the row new
+    columns = [
+        column.name for column in table.columns if column.name not in ("id", "sync_generation")
+    ]
+
+    for i in range(0, len(new_paths), chunk_size):
+        result = await session.execute(
+            select(table).where(table.c.file_path.in_(new_paths[i:i + chunk_size]))
         )
+        for row in result.mappings().all():
+            old = by_fingerprint.pop(row["fingerprint"], None)
+            if old is None:
+                continue
 
-    except Exception as e:
-        print(f"Error processing {file_path}: {e}")
-        return None
+            # Free the unique file_path before moving it onto the old row
+            await session.execute(delete(table).where(table.c.id == row["id"]))
+            await session.execute(
+                update(table)
+                .where(table.c.id == old.id)
+                .values({name: row[name] for name in columns})
+            )
+            await session.execute(
+                update(PlaylistEntry)
+                .where(PlaylistEntry.track_id == old.id)
+                .values(track_path=row["file_path"])
+            )
+            kept_ids.add(old.id)
+            print(f"Moved: {old.file_path} -> {row['file_path']}")
+
+    return kept_ids
+
+
+async def _remove_tracks(session: AsyncSession, track_ids: list, chunk_size: int = 500):
+    """Delete tracks, detaching playlist entries that pointed at them."""
+    for i in range(0, len(track_ids), chunk_size):
+        chunk = track_ids[i:i + chunk_size]
+        # Keep the entries; their track_path still records the original file
+        await session.execute(
+            update(PlaylistEntry)
+            .where(PlaylistEntry.track_id.in_(chunk))
+            .values(track_id=None)
+        )
+        await session.execute(delete(Track).where(Track.id.in_(chunk)))
+    await session.commit()
 
 
-def _get_tag(tags, keys: list) -> Optional[str]:
-    """Get a tag value trying multiple key names."""
-    for key in keys:
+class LibraryChanges(NamedTuple):
+    """What a batch of watched changes touched, for follow-up work to patch."""
+
+    track_ids: set  # Tracks written, including moved ones
+    removed_ids: set  # Tracks deleted
+    artists: set  # Track artists whose browse rows were rebuilt
+
+
+async def apply_changes(session: AsyncSession, changed_paths: set) -> LibraryChanges:
+    """Apply a batch of filesystem changes to the library.
+
+    ``changed_paths`` are absolute paths reported by the watcher. Each
+    affected directory is listed once: changed audio files are re-parsed or
+    removed, folder art and playlists are refreshed, new directories are
+    scanned and vanished ones drop their tracks.
+
+    Paths are matched against the filesystem rather than trusting the event
+    type, since a debounced batch may merge several events for one path.
+    Files are parsed before ``session`` first touches the database, so the
+    writer connection is free for other writes meanwhile.
+    """
+    music_path = Path(settings.music_path)
+    by_dir = {}
+    new_dirs = []
+
+    for path in map(Path, changed_paths):
         try:
-            if hasattr(tags, "get"):
-                val = tags.get(key)
-            elif hasattr(tags, "__getitem__"):
-                try:
-                    val = tags[key]
-                except (KeyError, IndexError):
-                    continue
-            else:
-                continue
+            path.relative_to(music_path)
+        except ValueError:
+            continue
+        if await asyncio.to_thread(path.is_dir):
+            new_dirs.append(path)
+        else:
+            by_dir.setdefault(path.parent, set()).add(path.name)
+
+    to_parse = {}
+    art_updates = []
+    playlists_to_process = {}
+    removed_paths = []
+    removed_dirs = []
+
+    for dir_path, names in by_dir.items():
+        files = []
+        art_name = None
+        if await asyncio.to_thread(dir_path.is_dir):
+            _, art_name, files = await asyncio.to_thread(_scan_directory, dir_path)
+
+        rel_root = dir_path.relative_to(music_path)
+        folder_art = str(rel_root / art_name) if art_name else None
+        present = {f[0]: f for f in files}
+
+        for name in names:
+            rel_path = str(rel_root / name)
+            ext = os.path.splitext(name)[1].lower()
+            found = present.get(name)
 
-            if val:
-                if isinstance(val, list):
-                    val = val[0]
-                if hasattr(val, "text"):
-                    return str(val.text[0]) if val.text else None
-                return str(val)
-        except Exception:
+            if ext in AUDIO_EXTENSIONS:
+                if found:
+                    to_parse[rel_path] = (str(dir_path / name), rel_path, folder_art, *found[2:])
+                else:
+                    removed_paths.append(rel_path)
+            elif ext in PLAYLIST_EXTENSIONS:
+                if found:
+                    playlists_to_process[rel_path] = dir_path / name
+                else:
+                    removed_paths.append(rel_path)
+            elif name not in ART_FILENAMES:
+                # Not a file we index, so possibly a directory that is gone
+                removed_dirs.append(rel_path)
+
+        if names & ART_FILENAMES:
+            audio_paths = [str(rel_root / f[0]) for f in files if f[1] in AUDIO_EXTENSIONS]
+            art_updates.append((folder_art, audio_paths))
+
+    scanned_dirs = []
+    for dir_path in sorted(new_dirs):
+        if any(dir_path.is_relative_to(parent) for parent in scanned_dirs):
             continue
-    return None
 
+        # Directories that already hold tracks report their changes per file
+        rel_dir = str(dir_path.relative_to(music_path))
+        if rel_dir == ".":
+            continue
+        async with read_session() as reader:
+            result = await reader.execute(
+                select(Track.id)
+                .where(Track.file_path.startswith(rel_dir + "/", autoescape=True))
+                .limit(1)
+            )
+            known = result.first()
+        if known:
+            continue
 
-def _has_embedded_art(audio, tags) -> bool:
-    """Check if audio file has embedded album art."""
-    try:
-        # FLAC, OGG
-        if hasattr(audio, "pictures") and audio.pictures:
-            return True
+        scanned_dirs.append(dir_path)
+        async for sub_path, rel_root, folder_art, files in _scan_library(music_path, dir_path):
+            for filename, ext, file_size, mtime, cache_key in files:
+                rel_path = str(rel_root / filename)
+                if ext in AUDIO_EXTENSIONS:
+                    to_parse[rel_path] = (
+                        str(sub_path / filename), rel_path, folder_art, file_size, mtime, cache_key
+                    )
+                else:
+                    playlists_to_process[rel_path] = sub_path / filename
+
+    # Re-parse new and changed files, unless their bytes are in the tag cache
+    tag_cache = _open_tag_cache()
+    items = list(to_parse.values())
+    cached = tag_cache.get_many([item[5] for item in items]) if tag_cache else {}
+    misses = [item for item in items if item[5] not in cached]
+    parsed = await asyncio.gather(*(asyncio.to_thread(read_tags, item[0]) for item in misses))
+
+    new_tags = [(item[5], tags) for item, tags in zip(misses, parsed) if tags]
+    if tag_cache:
+        tag_cache.put_many(new_tags)
+        tag_cache.close()
+    cached.update(new_tags)
+
+    tracks = [
+        track_values(cached[cache_key], rel_path, folder_art, file_size, mtime)
+        for path, rel_path, folder_art, file_size, mtime, cache_key in items
+        if cache_key in cached
+    ]
+    known_ids = await _lookup_track_ids(session, [t["file_path"] for t in tracks])
+    new_paths = [t["file_path"] for t in tracks if t["file_path"] not in known_ids]
+
+    # Artists whose browse rows change, both before and after this batch
+    art_paths = [path for _, audio_paths in art_updates for path in audio_paths]
+    affected_artists = {t["artist"] for t in tracks}
+    affected_artists |= await _lookup_artists(session, list(known_ids) + art_paths)
+
+    for i in range(0, len(tracks), settings.index_batch_size):
+        await _write_tracks(session, tracks[i:i + settings.index_batch_size])
+
+    for folder_art, audio_paths in art_updates:
+        if audio_paths:
+            await session.execute(
+                update(Track)
+                .where(Track.file_path.in_(audio_paths))
+                .values(has_folder_art=folder_art is not None, folder_art_path=folder_art)
+            )
 
-        # ID3 (MP3)
-        if hasattr(tags, "getall"):
-            if tags.getall("APIC"):
-                return True
+    # Remove vanished files and directories, unless they were renamed or moved
+    removed_ids = []
+    kept_ids = set()
+    if removed_paths or removed_dirs:
+        track_filter = Track.file_path.in_(removed_paths)
+        playlist_filter = Playlist.file_path.in_(removed_paths)
+        for rel_dir in removed_dirs:
+            track_filter |= Track.file_path.startswith(rel_dir + "/", autoescape=True)
+            playlist_filter |= Playlist.file_path.startswith(rel_dir + "/", autoescape=True)
 
-        # MP4/M4A
-        if tags and "covr" in tags:
-            return True
+        result = await session.execute(
+            select(Track.id, Track.file_path, Track.fingerprint, Track.artist).where(track_filter)
+        )
+        removed = result.all()
+        affected_artists |= {row.artist for row in removed}
+        kept_ids = await _preserve_moved_tracks(session, removed, new_paths)
+        removed_ids = [row.id for row in removed if row.id not in kept_ids]
+        await _remove_tracks(session, removed_ids)
 
-        return False
-    except Exception:
-        return False
+        result = await session.execute(
+            select(Playlist)
+            .where(Playlist.is_user_created == False)
+            .where(playlist_filter)
+        )
+        for playlist in result.scalars():
+            await session.delete(playlist)
 
+    if affected_artists:
+        await refresh_browse_tables(session, artists=affected_artists)
 
-async def process_playlist_file(session: AsyncSession, file_path: Path, rel_path: str):
-    """Process an M3U playlist file."""
+    # IDs of the written tracks, after moved ones took over their old rows
+    written_ids = await _lookup_track_ids(session, [t["file_path"] for t in tracks])
+
+    # Re-import changed playlists
+    for rel_path, playlist_path in playlists_to_process.items():
+        result = await session.execute(
+            select(Playlist)
+            .where(Playlist.is_user_created == False)
+            .where(Playlist.file_path == rel_path)
+        )
+        await process_playlist_file(
+            session, playlist_path, rel_path, playlist=result.scalar_one_or_none()
+        )
+
+    await generation.bump(session)
+    print(
+        f"Library updated: {len(tracks)} tracks written, {len(kept_ids)} moved, "
+        f"{len(removed_ids)} removed, "
+        f"{len(playlists_to_process)} playlists imported"
+    )
+    return LibraryChanges(set(written_ids.values()), set(removed_ids), affected_artists)
+
+
+async def process_playlist_file(
+    session: AsyncSession,
+    file_path: Path,
+    rel_path: str,
+    playlist: Optional[Playlist] = None,
+    track_ids: Optional[dict] = None,
+):
+    """Process an M3U playlist file.
+
+    If ``playlist`` is an existing imported playlist its entries are replaced,
+    keeping the playlist ID stable across re-indexing. Entry paths are
+    resolved against ``track_ids`` (a ``file_path -> id`` map) when given,
+    otherwise with one lookup for the whole playlist. The caller commits.
+    """
     try:
         name = file_path.stem
+        entry_paths = await asyncio.to_thread(_read_m3u, file_path)
 
-        playlist = Playlist(
-            name=name,
-            file_path=rel_path,
-            is_user_created=False,
-        )
-        session.add(playlist)
-        await session.flush()
+        if track_ids is None:
+            track_ids = await _lookup_track_ids(session, entry_paths)
 
-        # Parse M3U file
-        with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-            lines = f.readlines()
+        if playlist is None:
+            playlist = Playlist(
+                name=name,
+                file_path=rel_path,
+                is_user_created=False,
+            )
+            session.add(playlist)
+            await session.flush()
+        else:
+            playlist.name = name
+            await session.execute(
+                delete(PlaylistEntry).where(PlaylistEntry.playlist_id == playlist.id)
+            )
+
+        entries = [
+            {
+                "playlist_id": playlist.id,
+                "track_id": track_ids.get(track_path),
+                "track_path": track_path,
+                "position": position,
+            }
+            for position, track_path in enumerate(entry_paths)
+        ]
+        if entries:
+            await session.execute(insert(PlaylistEntry), entries)
+
+        print(f"Imported playlist: {name} ({len(entries)} tracks)")
+
+    except Exception as e:
+        print(f"Error processing playlist {file_path}: {e}")
 
-        position = 0
-        playlist_dir = file_path.parent
 
-        for line in lines:
+def _read_m3u(file_path: Path) -> list[str]:
+    """Read the entry paths of an M3U file.
+
+    Relative entries are made relative to the music folder; anything outside
+    it is kept as written.
+    """
+    music_root = os.path.normpath(settings.music_path)
+    playlist_dir = str(file_path.parent)
+    paths = []
+
+    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
             line = line.strip()
 
             # Skip comments and extended info
             if not line or line.startswith("#"):
                 continue
 
-            # Resolve relative paths
-            if not os.path.isabs(line):
-                track_path = (playlist_dir / line).resolve()
-                try:
-                    rel_track_path = str(track_path.relative_to(Path(settings.music_path)))
-                except ValueError:
-                    rel_track_path = line
-            else:
-                rel_track_path = line
+            if os.path.isabs(line):
+                paths.append(line)
+                continue
 
-            # Try to find matching track in database
-            result = await session.execute(
-                select(Track).where(Track.file_path == rel_track_path)
+            rel_track_path = os.path.relpath(
+                os.path.normpath(os.path.join(playlist_dir, line)), music_root
             )
-            track = result.scalar_one_or_none()
+            if rel_track_path == ".." or rel_track_path.startswith(".." + os.sep):
+                rel_track_path = line
+            paths.append(rel_track_path)
+
+    return paths
+
+
+async def refresh_browse_tables(
+    session: AsyncSession, artists: Optional[set] = None, chunk_size: int = 500
+):
+    """Rebuild the artist and album rows from the tracks table.
+
+    Browse endpoints read these rows instead of aggregating every track per
+    request. With ``artists``, only the rows of those track artists (which
+    may include ``None``) are rebuilt. The caller commits.
+    """
+    # Tell delta sync clients to reload the browse rows
+    await session.execute(
+        update(LibraryState).values(browse_generation=literal_column(PENDING_GENERATION))
+    )
+
+    if artists is None:
+        await session.execute(delete(Album))
+        await session.execute(delete(Artist))
+        await _insert_browse_rows(session)
+        return
+
+    names = list(artists)
+    for i in range(0, len(names), chunk_size):
+        chunk = names[i:i + chunk_size]
+        await session.execute(delete(Album).where(artist_in(Album.artist, chunk)))
+        await session.execute(delete(Artist).where(artist_in(Artist.name, chunk)))
+        await _insert_browse_rows(session, artist_in(Track.artist, chunk))
+
+
+async def _insert_browse_rows(session: AsyncSession, track_filter=None):
+    """Aggregate the matching tracks into artist and album rows."""
+    has_art = or_(
+        Track.has_embedded_art,
+        and_(Track.has_folder_art, Track.folder_art_path.isnot(None)),
+    )
+    art_track_id = func.min(case((has_art, Track.id)))
+
+    albums = select(
+        Track.album,
+        Track.artist,
+        Track.album_artist,
+        func.count(Track.id),
+        func.sum(Track.duration),
+        func.min(Track.year),
+        art_track_id,
+    ).group_by(Track.album, Track.artist, Track.album_artist)
+
+    artists = (
+        select(
+            Track.artist,
+            func.count(Track.id),
+            func.count(Track.album.distinct()),
+            func.sum(Track.duration),
+            art_track_id,
+        )
+        .where(Track.artist.isnot(None))
+        .group_by(Track.artist)
+    )
+
+    if track_filter is not None:
+        albums = albums.where(track_filter)
+        artists = artists.where(track_filter)
+
+    await session.execute(
+        insert(Album.__table__).from_select(
+            ["name", "artist", "album_artist", "track_count", "total_duration", "year",
+             "art_track_id"],
+            albums,
+        )
+    )
+    await session.execute(
+        insert(Artist.__table__).from_select(
+            ["name", "track_count", "album_count", "total_duration", "art_track_id"],
+            artists,
+        )
+    )
 
-            entry = PlaylistEntry(
-                playlist_id=playlist.id,
-                track_id=track.id if track else None,
-                track_path=rel_track_path,
-                position=position,
-            )
-            session.add(entry)
-            position += 1
 
-        await session.commit()
-        print(f"Imported playlist: {name} ({position} tracks)")
+async def _has_browse_rows(session: AsyncSession) -> bool:
+    """Whether the browse tables have been built."""
+    result = await session.execute(select(Album.id).limit(1))
+    return result.first() is not None
 
-    except Exception as e:
-        print(f"Error processing playlist {file_path}: {e}")
+
+async def _lookup_artists(session: AsyncSession, paths: list, chunk_size: int = 500) -> set:
+    """Artists of the tracks at the given file paths."""
+    artists = set()
+    unique_paths = list(set(paths))
+    for i in range(0, len(unique_paths), chunk_size):
+        result = await session.execute(
+            select(Track.artist)
+            .where(Track.file_path.in_(unique_paths[i:i + chunk_size]))
+            .distinct()
+        )
+        artists.update(result.scalars())
+    return artists
+
+
+async def _lookup_track_ids(session: AsyncSession, paths: list, chunk_size: int = 500) -> dict:
+    """Map the given file paths to track IDs in a few set-based queries."""
+    track_ids = {}
+    unique_paths = list(set(paths))
+    for i in range(0, len(unique_paths), chunk_size):
+        result = await session.execute(
+            select(Track.file_path, Track.id)
+            .where(Track.file_path.in_(unique_paths[i:i + chunk_size]))
+        )
+        track_ids.update(result.all())
+    return track_ids
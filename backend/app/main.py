@@ -7,7 +7,8 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 
 from .config import settings
-from .models import init_db
+from . import generation
+from .models import init_db, async_session
 from .routers import sonos, library, streaming, playlists
 
 
@@ -22,16 +23,45 @@ async def lifespan(app: FastAPI):
 
     # Initialize database
     await init_db()
+    await generation.load()
 
-    # Start background indexing if enabled
+    # Start background indexing if enabled. This also resumes a run that was
+    # interrupted by a restart; otherwise such runs are just marked stale.
     if settings.index_on_startup:
         from .library import start_background_index
         asyncio.create_task(start_background_index())
+    else:
+        from .library import recover_interrupted_index
+        async with async_session() as session:
+            await recover_interrupted_index(session)
+
+    # Load the typo-tolerant search index from the existing library
+    from . import fuzzy_search
+    fuzzy_search.schedule_rebuild()
+
+    # Render thumbnails of covers the last index left without them
+    from . import art_cache
+    art_cache.schedule_thumbnails()
+
+    # Load the track ID to file map used by /stream/id
+    from . import stream_paths
+    asyncio.create_task(stream_paths.refresh())
+
+    # Keep the library in sync with the music folder if enabled
+    watcher_stop = asyncio.Event()
+    watcher_task = None
+    if settings.watch_library:
+        from .watcher import watch_library
+        watcher_task = asyncio.create_task(watch_library(watcher_stop))
 
     yield
 
     # Shutdown
     print("Shutting down Sonos Controller...")
+    watcher_stop.set()
+    if watcher_task:
+        # Let the watch thread exit before the event loop closes
+        await watcher_task
 
 
 app = FastAPI(
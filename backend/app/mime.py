@@ -0,0 +1,19 @@
+import mimetypes
+from pathlib import Path
+
+# MIME types for supported formats
+MIME_TYPES = {
+    ".mp3": "audio/mpeg",
+    ".m4a": "audio/mp4",
+    ".wav": "audio/wav",
+    ".flac": "audio/flac",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+}
+
+
+def get_mime_type(file_path: str) -> str:
+    """Get MIME type for a file."""
+    ext = Path(file_path).suffix.lower()
+    return MIME_TYPES.get(ext, mimetypes.guess_type(file_path)[0] or "application/octet-stream")
@@ -1,6 +1,12 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Text, ForeignKey
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy import (
+    Column, Integer, String, Boolean, DateTime, Float, Text, ForeignKey, Index,
+    column, event, func, inspect, literal_column, or_, table, text,
+)
+from sqlalchemy.engine import make_url
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship
 
 from .config import settings
@@ -36,6 +42,10 @@ class Track(Base):
     file_size = Column(Integer)
     file_format = Column(String)  # mp3, m4a, wav
     last_modified = Column(DateTime)
+    fingerprint = Column(String, index=True)  # Content hash used to follow renames and moves
+
+    # Generation in which the row last changed, for delta sync
+    sync_generation = Column(Integer, index=True)
 
     # Indexing metadata
     indexed_at = Column(DateTime, default=datetime.utcnow)
@@ -44,6 +54,54 @@ class Track(Base):
         return f"<Track {self.artist} - {self.title}>"
 
 
+# Browse order of tracks. NULLs are folded to literals so the keys can be
+# compared as a row value for cursor pagination, served by one index.
+TRACK_SORT_KEYS = (
+    func.coalesce(Track.artist, literal_column("''")),
+    func.coalesce(Track.album, literal_column("''")),
+    func.coalesce(Track.track_number, literal_column("0")),
+    Track.id,
+)
+Index("ix_tracks_browse_order", *TRACK_SORT_KEYS)
+
+
+def artist_in(column, names: list):
+    """Match ``column`` against artist names, where ``None`` matches NULL."""
+    clause = column.in_([name for name in names if name is not None])
+    if None in names:
+        clause = or_(clause, column.is_(None))
+    return clause
+
+
+class Artist(Base):
+    """A track artist with totals precomputed by the indexer for browsing."""
+
+    __tablename__ = "artists"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String, unique=True, nullable=False, index=True)
+    track_count = Column(Integer, default=0)
+    album_count = Column(Integer, default=0)
+    total_duration = Column(Float)  # Duration in seconds
+    art_track_id = Column(Integer)  # A track whose art represents the artist
+
+
+class Album(Base):
+    """An album as grouped by name, track artist and album artist, with totals
+    precomputed by the indexer for browsing."""
+
+    __tablename__ = "albums"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String, index=True)
+    artist = Column(String, index=True)
+    album_artist = Column(String)
+    track_count = Column(Integer, default=0)
+    total_duration = Column(Float)  # Duration in seconds
+    year = Column(Integer)  # Earliest track year
+    art_track_id = Column(Integer)  # A track whose art represents the album
+
+
 class Playlist(Base):
     """A user-created or imported playlist."""
 
@@ -84,26 +142,209 @@ class IndexStatus(Base):
     __tablename__ = "index_status"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    status = Column(String, default="idle")  # idle, running, completed, error
+    status = Column(String, default="idle")  # idle, running, completed, error, interrupted
     started_at = Column(DateTime)
     completed_at = Column(DateTime)
     total_files = Column(Integer, default=0)
     processed_files = Column(Integer, default=0)
     error_message = Column(Text)
+    full_scan = Column(Boolean, default=False)  # Re-parse every file, not just changed ones
 
 
-# Database engine and session
-engine = create_async_engine(settings.database_url, echo=False)
+class LibraryState(Base):
+    """Single row holding the library generation, bumped on every change."""
+
+    __tablename__ = "library_state"
+
+    id = Column(Integer, primary_key=True)
+    generation = Column(Integer, nullable=False)
+    browse_generation = Column(Integer)  # When the artist and album rows last changed
+
+
+class DeletedTrack(Base):
+    """Tombstone of a removed track, so delta sync can report the removal."""
+
+    __tablename__ = "deleted_tracks"
+
+    track_id = Column(Integer, primary_key=True)
+    sync_generation = Column(Integer, nullable=False, index=True)
+
+
+class IndexCheckpoint(Base):
+    """A directory fully written by an index run, used to resume after a restart."""
+
+    __tablename__ = "index_checkpoints"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    run_id = Column(Integer, ForeignKey("index_status.id"), nullable=False, index=True)
+    directory = Column(String, nullable=False)  # Relative to the music path
+
+
+# Database engines and sessions: SQLite allows one writer at a time, so
+# writes share a single connection while reads use their own pool and, in
+# WAL mode, never wait for the writer.
+def _create_engine(readonly: bool = False) -> AsyncEngine:
+    """Create an engine whose connections are tuned for the library database."""
+    url = make_url(settings.database_url)
+    if url.get_backend_name() != "sqlite":
+        return create_async_engine(url, echo=False)
+
+    pool_size = settings.db_read_connections if readonly else 1
+    new_engine = create_async_engine(
+        url, echo=False, poolclass=AsyncAdaptedQueuePool, pool_size=pool_size, max_overflow=0
+    )
+
+    @event.listens_for(new_engine.sync_engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not readonly:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA cache_size=-{settings.db_cache_size_mb * 1024}")
+        cursor.execute(f"PRAGMA mmap_size={settings.db_mmap_size_mb * 1024 * 1024}")
+        cursor.execute(f"PRAGMA busy_timeout={settings.db_busy_timeout_ms}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        if readonly:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+    return new_engine
+
+
+engine = _create_engine()
+read_engine = _create_engine(readonly=True)
 async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+read_session = sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+
+
+# Full-text index over track metadata, an external-content FTS5 table that
+# reads its text from ``tracks`` and is kept in step by triggers
+tracks_fts = table("tracks_fts", column("rowid"), column("rank"))
+SEARCH_COLUMNS = ("title", "artist", "album", "album_artist", "genre")
+_SEARCH_WEIGHTS = "10.0, 5.0, 3.0, 2.0, 1.0"
 
 
 async def init_db():
     """Initialize the database, creating tables if they don't exist."""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_create_missing_indexes)
+        if conn.dialect.name == "sqlite":
+            await conn.run_sync(_create_search_index)
+            await conn.run_sync(_create_sync_triggers)
+
+
+def _add_missing_columns(conn):
+    """Add columns introduced since the database was created.
+
+    ``create_all`` only creates missing tables, so new columns on existing
+    tables are added here. Existing rows get NULL for them.
+    """
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(conn.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+
+def _create_missing_indexes(conn):
+    """Create indexes introduced since the database was created.
+
+    Like columns, ``create_all`` skips indexes on tables that already exist.
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+# Generation that the next bump will publish. Rows written in between are
+# stamped with it, so they are newer than any generation a client has seen.
+PENDING_GENERATION = "(SELECT COALESCE(MAX(generation), 0) + 1 FROM library_state)"
+
+
+def _create_sync_triggers(conn):
+    """Stamp changed tracks and record removed ones for delta sync.
+
+    Covering every write path in the database keeps the indexer, the
+    watcher and move detection free of sync bookkeeping.
+    """
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS tracks_sync_insert AFTER INSERT ON tracks BEGIN "
+        f"UPDATE tracks SET sync_generation = {PENDING_GENERATION} WHERE id = new.id; "
+        "DELETE FROM deleted_tracks WHERE track_id = new.id; END"
+    ))
+    # Skips the trigger's own stamping update
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS tracks_sync_update AFTER UPDATE ON tracks "
+        "WHEN new.sync_generation IS old.sync_generation BEGIN "
+        f"UPDATE tracks SET sync_generation = {PENDING_GENERATION} WHERE id = new.id; END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS tracks_sync_delete AFTER DELETE ON tracks BEGIN "
+        "INSERT OR REPLACE INTO deleted_tracks (track_id, sync_generation) "
+        f"VALUES (old.id, {PENDING_GENERATION}); END"
+    ))
+    # Rows an upsert once left unstamped may hold changes no client has seen
+    conn.execute(text(
+        f"UPDATE tracks SET sync_generation = {PENDING_GENERATION} "
+        "WHERE sync_generation IS NULL"
+    ))
+
+
+def _create_search_index(conn):
+    """Create the track search index and its sync triggers.
+
+    Every write to ``tracks`` updates the index through the triggers, so the
+    indexer, the watcher and moves need no extra work. An index created for
+    an existing library is filled from the tracks table.
+    """
+    exists = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tracks_fts'")
+    ).first()
+    if exists:
+        return
+
+    columns = ", ".join(SEARCH_COLUMNS)
+    new_values = ", ".join(f"new.{name}" for name in SEARCH_COLUMNS)
+    old_values = ", ".join(f"old.{name}" for name in SEARCH_COLUMNS)
+    delete_old = (
+        f"INSERT INTO tracks_fts (tracks_fts, rowid, {columns}) "
+        f"VALUES ('delete', old.id, {old_values});"
+    )
+    insert_new = f"INSERT INTO tracks_fts (rowid, {columns}) VALUES (new.id, {new_values});"
+
+    conn.execute(text(
+        f"CREATE VIRTUAL TABLE tracks_fts USING fts5({columns}, "
+        "content='tracks', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')"
+    ))
+    # Rank title matches above artist, album, album artist and genre
+    conn.execute(text(
+        f"INSERT INTO tracks_fts (tracks_fts, rank) VALUES ('rank', 'bm25({_SEARCH_WEIGHTS})')"
+    ))
+    conn.execute(text(
+        f"CREATE TRIGGER tracks_fts_insert AFTER INSERT ON tracks BEGIN {insert_new} END"
+    ))
+    conn.execute(text(
+        f"CREATE TRIGGER tracks_fts_delete AFTER DELETE ON tracks BEGIN {delete_old} END"
+    ))
+    conn.execute(text(
+        f"CREATE TRIGGER tracks_fts_update AFTER UPDATE OF {columns} ON tracks "
+        f"BEGIN {delete_old} {insert_new} END"
+    ))
+    conn.execute(text("INSERT INTO tracks_fts (tracks_fts) VALUES ('rebuild')"))
 
 
 async def get_session() -> AsyncSession:
     """Get a database session."""
     async with async_session() as session:
         yield session
+
+
+async def get_read_session() -> AsyncSession:
+    """Get a read-only database session that doesn't wait on index writes."""
+    async with read_session() as session:
+        yield session
@@ -0,0 +1,104 @@
+import functools
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import generation
+from .config import settings
+from .serializers import dumps, library_response
+
+
+class ResponseCache:
+    """LRU cache of serialized responses for one library generation.
+
+    Entries are dropped all at once when the generation changes, and the
+    least recently used ones are evicted beyond ``max_bytes`` of bodies.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, generation: int) -> Optional[bytes]:
+        """The cached body for ``key`` at ``generation``, counting the lookup."""
+        if generation != self.generation:
+            self.clear()
+            self.generation = generation
+
+        body = self.entries.get(key)
+        if body is None:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return body
+
+    def put(self, key, generation: int, body: bytes):
+        """Cache a body computed at ``generation``, unless that has passed."""
+        if generation != self.generation or len(body) > self.max_bytes:
+            return
+
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self.entries[key] = body
+        self.size += len(body)
+
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "generation": self.generation,
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+response_cache = ResponseCache(settings.response_cache_mb * 1024 * 1024)
+
+
+def cached(endpoint):
+    """Serve an endpoint's JSON from ``response_cache``.
+
+    The key is the endpoint and its parsed query and path parameters, so
+    parameter order and omitted defaults don't matter. Hits skip the
+    endpoint entirely and never touch the database.
+    """
+
+    @functools.wraps(endpoint)
+    async def wrapper(**kwargs):
+        current = generation.current()
+        if current is None:
+            return await endpoint(**kwargs)
+
+        params = tuple(sorted(
+            (name, value) for name, value in kwargs.items()
+            if not isinstance(value, AsyncSession)
+        ))
+        key = (endpoint.__name__, params)
+
+        body = response_cache.get(key, current)
+        if body is None:
+            body = dumps(await endpoint(**kwargs))
+            response_cache.put(key, current, body)
+
+        return library_response(body, current)
+
+    return wrapper
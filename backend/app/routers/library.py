@@ -1,16 +1,35 @@
+import base64
+import json
+import re
 from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import select, func, distinct
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import select, func, distinct, literal, literal_column, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..models import Track, IndexStatus, get_session
+from ..models import (
+    Track, Artist, Album, IndexStatus, LibraryState, DeletedTrack, TRACK_SORT_KEYS,
+    get_read_session, read_session, tracks_fts,
+)
 from ..config import settings
+from .. import fuzzy_search, generation
+from ..response_cache import cached, response_cache
+from ..serializers import (
+    ART_COLUMNS, TRACK_COLUMNS, art_thumbnails, art_url, dumps, json_response, library_response,
+    track_to_dict,
+)
 
 router = APIRouter()
 
+# Answer GETs with 304 while the library generation is unchanged
+_CONDITIONAL_GET = [Depends(generation.conditional_get)]
+
+# Exact search results below which fuzzy matches are added
+_FUZZY_MIN_RESULTS = 3
+
 
 @router.get("/status")
-async def get_index_status(session: AsyncSession = Depends(get_session)):
+async def get_index_status(session: AsyncSession = Depends(get_read_session)):
     """Get the current indexing status."""
     result = await session.execute(
         select(IndexStatus).order_by(IndexStatus.id.desc()).limit(1)
@@ -30,86 +49,102 @@ async def get_index_status(session: AsyncSession = Depends(get_session)):
     }
 
 
+@router.get("/cache")
+async def get_cache_stats():
+    """Get hit and miss counts of the browse response cache."""
+    return response_cache.stats()
+
+
 @router.post("/reindex")
-async def trigger_reindex():
-    """Trigger a library re-index."""
+async def trigger_reindex(full: bool = False):
+    """Trigger a library re-index.
+
+    Only new and changed files are re-parsed unless ``full`` is set.
+    """
     from ..library import start_background_index
     import asyncio
 
-    asyncio.create_task(start_background_index(force=True))
-    return {"status": "indexing_started"}
+    asyncio.create_task(start_background_index(force=True, full=full))
+    return {"status": "indexing_started", "full": full}
 
 
-@router.get("/stats")
-async def get_library_stats(session: AsyncSession = Depends(get_session)):
+@router.get("/stats", dependencies=_CONDITIONAL_GET)
+@cached
+async def get_library_stats(session: AsyncSession = Depends(get_read_session)):
     """Get library statistics."""
-    # Count tracks
-    track_count = await session.execute(select(func.count(Track.id)))
+    # Track totals, summed from the per-album rows
+    totals = await session.execute(
+        select(func.sum(Album.track_count), func.sum(Album.total_duration))
+    )
+    track_count, total_duration = totals.one()
 
     # Count unique artists
-    artist_count = await session.execute(
-        select(func.count(distinct(Track.artist))).where(Track.artist.isnot(None))
-    )
+    artist_count = await session.execute(select(func.count(Artist.id)))
 
-    # Count unique albums
+    # Count unique album names
     album_count = await session.execute(
-        select(func.count(distinct(Track.album))).where(Track.album.isnot(None))
-    )
-
-    # Total duration
-    total_duration = await session.execute(
-        select(func.sum(Track.duration)).where(Track.duration.isnot(None))
+        select(func.count(distinct(Album.name))).where(Album.name.isnot(None))
     )
 
     return {
-        "tracks": track_count.scalar() or 0,
+        "tracks": track_count or 0,
         "artists": artist_count.scalar() or 0,
         "albums": album_count.scalar() or 0,
-        "total_duration": total_duration.scalar() or 0,
+        "total_duration": total_duration or 0,
     }
 
 
-@router.get("/artists")
+@router.get("/artists", dependencies=_CONDITIONAL_GET)
+@cached
 async def get_artists(
-    session: AsyncSession = Depends(get_session),
-    limit: int = Query(100, le=500),
+    session: AsyncSession = Depends(get_read_session),
+    limit: int = Query(100, ge=1, le=500),
     offset: int = 0,
+    cursor: Optional[str] = None,
     search: Optional[str] = None,
 ):
-    """Get list of artists."""
+    """Get list of artists.
+
+    Pass the ``next_cursor`` of a response as ``cursor`` to get the next page.
+    """
     query = (
-        select(Track.artist, func.count(Track.id).label("track_count"))
-        .where(Track.artist.isnot(None))
-        .group_by(Track.artist)
-        .order_by(Track.artist)
+        select(Artist, *ART_COLUMNS)
+        .outerjoin(Track, Track.id == Artist.art_track_id)
     )
 
     if search:
-        query = query.where(Track.artist.ilike(f"%{search}%"))
-
-    query = query.offset(offset).limit(limit)
-    result = await session.execute(query)
+        query = query.where(Artist.name.ilike(f"%{search}%"))
+
+    query = _paginate(query, (Artist.name,), limit, offset, cursor)
+    rows = (await session.execute(query)).all()
+    next_cursor = _next_cursor(rows, limit, lambda row: [row.Artist.name])
+
+    artists = []
+    for row in rows[:limit]:
+        artists.append({
+            "name": row.Artist.name,
+            "track_count": row.Artist.track_count,
+            "album_count": row.Artist.album_count,
+            "total_duration": row.Artist.total_duration,
+            "art_url": art_url(row),
+            "art_thumbnails": art_thumbnails(row),
+        })
 
-    artists = [{"name": row.artist, "track_count": row.track_count} for row in result]
-    return {"artists": artists}
+    return {"artists": artists, "next_cursor": next_cursor}
 
 
-@router.get("/artists/{artist}/albums")
+@router.get("/artists/{artist}/albums", dependencies=_CONDITIONAL_GET)
+@cached
 async def get_artist_albums(
     artist: str,
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
 ):
     """Get albums by an artist."""
     query = (
-        select(
-            Track.album,
-            Track.album_artist,
-            func.count(Track.id).label("track_count"),
-            func.min(Track.year).label("year"),
-        )
-        .where(Track.artist == artist)
-        .group_by(Track.album, Track.album_artist)
-        .order_by(Track.year, Track.album)
+        select(Album, *ART_COLUMNS)
+        .outerjoin(Track, Track.id == Album.art_track_id)
+        .where(Album.artist == artist)
+        .order_by(Album.year, Album.name)
     )
 
     result = await session.execute(query)
@@ -117,64 +152,70 @@ async def get_artist_albums(
     albums = []
     for row in result:
         albums.append({
-            "name": row.album or "Unknown Album",
+            "name": row.Album.name or "Unknown Album",
             "artist": artist,
-            "album_artist": row.album_artist,
-            "track_count": row.track_count,
-            "year": row.year,
+            "album_artist": row.Album.album_artist,
+            "track_count": row.Album.track_count,
+            "total_duration": row.Album.total_duration,
+            "year": row.Album.year,
+            "art_url": art_url(row),
+            "art_thumbnails": art_thumbnails(row),
         })
 
     return {"albums": albums, "artist": artist}
 
 
-@router.get("/albums")
+@router.get("/albums", dependencies=_CONDITIONAL_GET)
+@cached
 async def get_albums(
-    session: AsyncSession = Depends(get_session),
-    limit: int = Query(100, le=500),
+    session: AsyncSession = Depends(get_read_session),
+    limit: int = Query(100, ge=1, le=500),
     offset: int = 0,
+    cursor: Optional[str] = None,
     search: Optional[str] = None,
 ):
-    """Get list of albums."""
+    """Get list of albums.
+
+    Pass the ``next_cursor`` of a response as ``cursor`` to get the next page.
+    """
     query = (
-        select(
-            Track.album,
-            Track.artist,
-            Track.album_artist,
-            func.count(Track.id).label("track_count"),
-            func.min(Track.year).label("year"),
-        )
-        .where(Track.album.isnot(None))
-        .group_by(Track.album, Track.artist, Track.album_artist)
-        .order_by(Track.album)
+        select(Album, *ART_COLUMNS)
+        .outerjoin(Track, Track.id == Album.art_track_id)
+        .where(Album.name.isnot(None))
     )
 
     if search:
-        query = query.where(Track.album.ilike(f"%{search}%"))
+        query = query.where(Album.name.ilike(f"%{search}%"))
 
-    query = query.offset(offset).limit(limit)
-    result = await session.execute(query)
+    query = _paginate(query, (Album.name, Album.id), limit, offset, cursor)
+    rows = (await session.execute(query)).all()
+    next_cursor = _next_cursor(rows, limit, lambda row: [row.Album.name, row.Album.id])
 
     albums = []
-    for row in result:
+    for row in rows[:limit]:
         albums.append({
-            "name": row.album,
-            "artist": row.artist or row.album_artist,
-            "track_count": row.track_count,
-            "year": row.year,
+            "name": row.Album.name,
+            "artist": row.Album.artist or row.Album.album_artist,
+            "track_count": row.Album.track_count,
+            "total_duration": row.Album.total_duration,
+            "year": row.Album.year,
+            "art_url": art_url(row),
+            "art_thumbnails": art_thumbnails(row),
         })
 
-    return {"albums": albums}
+    return {"albums": albums, "next_cursor": next_cursor}
 
 
-@router.get("/albums/{album}/tracks")
+@router.get("/albums/{album}/tracks", dependencies=_CONDITIONAL_GET)
+@json_response
 async def get_album_tracks(
     album: str,
     artist: Optional[str] = None,
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
 ):
     """Get tracks in an album."""
     query = (
-        select(Track)
+        select(*TRACK_COLUMNS)
         .where(Track.album == album)
         .order_by(Track.disc_number, Track.track_number, Track.title)
     )
@@ -183,32 +224,37 @@ async def get_album_tracks(
         query = query.where(Track.artist == artist)
 
     result = await session.execute(query)
-    tracks = result.scalars().all()
+    tracks = result.all()
 
     return {
         "album": album,
         "artist": artist,
-        "tracks": [_track_to_dict(t) for t in tracks],
+        "tracks": [track_to_dict(t) for t in tracks],
     }
 
 
-@router.get("/tracks")
+@router.get("/tracks", dependencies=_CONDITIONAL_GET)
+@json_response
 async def get_tracks(
-    session: AsyncSession = Depends(get_session),
-    limit: int = Query(100, le=500),
+    session: AsyncSession = Depends(get_read_session),
+    limit: int = Query(100, ge=1, le=500),
     offset: int = 0,
+    cursor: Optional[str] = None,
     search: Optional[str] = None,
     artist: Optional[str] = None,
     album: Optional[str] = None,
 ):
-    """Get tracks with optional filtering."""
-    query = select(Track).order_by(Track.artist, Track.album, Track.track_number)
+    """Get tracks with optional filtering.
+
+    Pass the ``next_cursor`` of a response as ``cursor`` to get the next page.
+    """
+    query = select(*TRACK_COLUMNS)
 
     if search:
+        if not _match_terms(search):
+            return {"tracks": [], "next_cursor": None}
         query = query.where(
-            Track.title.ilike(f"%{search}%")
-            | Track.artist.ilike(f"%{search}%")
-            | Track.album.ilike(f"%{search}%")
+            Track.id.in_(select(tracks_fts.c.rowid).where(_search_match(search)))
         )
 
     if artist:
@@ -217,39 +263,51 @@ async def get_tracks(
     if album:
         query = query.where(Track.album == album)
 
-    query = query.offset(offset).limit(limit)
-    result = await session.execute(query)
-    tracks = result.scalars().all()
+    query = _paginate(query, TRACK_SORT_KEYS, limit, offset, cursor)
+    tracks = (await session.execute(query)).all()
+    next_cursor = _next_cursor(
+        tracks, limit, lambda t: [t.artist or "", t.album or "", t.track_number or 0, t.id]
+    )
 
-    return {"tracks": [_track_to_dict(t) for t in tracks]}
+    return {"tracks": [track_to_dict(t) for t in tracks[:limit]], "next_cursor": next_cursor}
 
 
-@router.get("/tracks/{track_id}")
-async def get_track(track_id: int, session: AsyncSession = Depends(get_session)):
+@router.get("/tracks/{track_id}", dependencies=_CONDITIONAL_GET)
+@json_response
+async def get_track(track_id: int, session: AsyncSession = Depends(get_read_session)):
     """Get a specific track by ID."""
-    result = await session.execute(select(Track).where(Track.id == track_id))
-    track = result.scalar_one_or_none()
+    result = await session.execute(select(*TRACK_COLUMNS).where(Track.id == track_id))
+    track = result.one_or_none()
 
     if not track:
         raise HTTPException(status_code=404, detail="Track not found")
 
-    return _track_to_dict(track)
+    return track_to_dict(track)
 
 
-@router.get("/search")
+@router.get("/search", dependencies=_CONDITIONAL_GET)
+@json_response
 async def search_library(
     q: str,
-    session: AsyncSession = Depends(get_session),
-    limit: int = Query(20, le=100),
+    session: AsyncSession = Depends(get_read_session),
+    limit: int = Query(20, ge=1, le=100),
 ):
-    """Search across artists, albums, and tracks."""
-    search_term = f"%{q}%"
+    """Search across artists, albums, and tracks.
+
+    Each word of ``q`` is matched as a prefix against the full-text index,
+    and results are ordered by relevance. When that finds almost nothing,
+    typo-tolerant matches are appended and ``fuzzy`` is set.
+    """
+    if not _match_terms(q):
+        return {"artists": [], "albums": [], "tracks": [], "fuzzy": False}
 
     # Search artists
     artist_query = (
         select(Track.artist)
-        .where(Track.artist.ilike(search_term))
-        .distinct()
+        .join(tracks_fts, tracks_fts.c.rowid == Track.id)
+        .where(_search_match(q, "artist"))
+        .group_by(Track.artist)
+        .order_by(func.min(tracks_fts.c.rank))
         .limit(limit)
     )
     artist_result = await session.execute(artist_query)
@@ -258,8 +316,10 @@ async def search_library(
     # Search albums
     album_query = (
         select(Track.album, Track.artist)
-        .where(Track.album.ilike(search_term))
-        .distinct()
+        .join(tracks_fts, tracks_fts.c.rowid == Track.id)
+        .where(_search_match(q, "album"))
+        .group_by(Track.album, Track.artist)
+        .order_by(func.min(tracks_fts.c.rank))
         .limit(limit)
     )
     album_result = await session.execute(album_query)
@@ -267,50 +327,243 @@ async def search_library(
 
     # Search tracks
     track_query = (
-        select(Track)
-        .where(Track.title.ilike(search_term))
+        select(*TRACK_COLUMNS)
+        .join(tracks_fts, tracks_fts.c.rowid == Track.id)
+        .where(_search_match(q))
+        .order_by(tracks_fts.c.rank)
         .limit(limit)
     )
     track_result = await session.execute(track_query)
-    tracks = [_track_to_dict(t) for t in track_result.scalars()]
+    tracks = [track_to_dict(t) for t in track_result]
+
+    # Too few exact matches, likely a typo: add approximate ones
+    fuzzy = len(artists) + len(albums) + len(tracks) < _FUZZY_MIN_RESULTS
+    if fuzzy:
+        matches = fuzzy_search.search(q, limit=limit)
+        for name in matches.get("artist", []):
+            if name not in artists and len(artists) < limit:
+                artists.append(name)
+        for name, artist in matches.get("album", []):
+            album = {"name": name, "artist": artist}
+            if album not in albums and len(albums) < limit:
+                albums.append(album)
+
+        known_ids = {t["id"] for t in tracks}
+        track_ids = [i for i in matches.get("track", []) if i not in known_ids]
+        if track_ids:
+            result = await session.execute(
+                select(*TRACK_COLUMNS).where(Track.id.in_(track_ids))
+            )
+            by_id = {t.id: t for t in result}
+            tracks += [track_to_dict(by_id[i]) for i in track_ids if i in by_id]
+            tracks = tracks[:limit]
 
     return {
         "artists": artists,
         "albums": albums,
         "tracks": tracks,
+        "fuzzy": fuzzy,
     }
 
 
-def _track_to_dict(track: Track) -> dict:
-    """Convert a Track to a dictionary with stream URLs."""
-    from urllib.parse import quote
+@router.get("/sync", dependencies=_CONDITIONAL_GET)
+async def get_sync_snapshot(session: AsyncSession = Depends(get_read_session)):
+    """Get the whole library as columnar arrays for clients keeping a copy.
+
+    Pass the returned ``generation`` to ``/sync/changes`` to catch up later.
+    Stream and art URLs are left for the client to build from
+    ``stream_base_url``, as in ``serializers.track_to_dict``.
+    """
+    # The generation is read first, so anything that changes while the rows
+    # are read is sent again by the next delta rather than missed
+    state = await _library_state(session)
+    return _sync_response(state.generation, {
+        "tracks": await _columns(session, select(*TRACK_COLUMNS)),
+        "artists": await _columns(session, select(*_SYNC_ARTIST_COLUMNS)),
+        "albums": await _columns(session, select(*_SYNC_ALBUM_COLUMNS)),
+    })
+
+
+@router.get("/sync/changes", dependencies=_CONDITIONAL_GET)
+async def get_sync_changes(since: int, session: AsyncSession = Depends(get_read_session)):
+    """Get what changed after generation ``since``.
+
+    Changed and added tracks replace the client's rows by ``id`` and
+    ``deleted_track_ids`` are removed. Artists and albums are summaries
+    over many tracks, so when any changed they are sent whole to replace
+    the client's copy, and are ``null`` otherwise.
+    """
+    state = await _library_state(session)
+    if since > state.generation:
+        raise HTTPException(
+            status_code=410, detail="Unknown generation, fetch a new snapshot"
+        )
 
-    # URL-encode the file path (safe='/' keeps path separators)
-    encoded_path = quote(track.file_path, safe='/')
-    stream_url = f"{settings.stream_base_url}/stream/{encoded_path}"
-    art_url = None
+    tracks = await _columns(
+        session, select(*TRACK_COLUMNS).where(Track.sync_generation > since)
+    )
+    deleted = await session.execute(
+        select(DeletedTrack.track_id).where(DeletedTrack.sync_generation > since)
+    )
 
-    if track.has_embedded_art:
-        art_url = f"{settings.stream_base_url}/stream/art/embedded/{track.id}"
-    elif track.has_folder_art and track.folder_art_path:
-        encoded_art_path = quote(track.folder_art_path, safe='/')
-        art_url = f"{settings.stream_base_url}/stream/art/{encoded_art_path}"
-    else:
-        art_url = "/generic_album.jpg"
+    artists = albums = None
+    if state.browse_generation is None or state.browse_generation > since:
+        artists = await _columns(session, select(*_SYNC_ARTIST_COLUMNS))
+        albums = await _columns(session, select(*_SYNC_ALBUM_COLUMNS))
 
-    return {
-        "id": track.id,
-        "title": track.title,
-        "artist": track.artist,
-        "album": track.album,
-        "album_artist": track.album_artist,
-        "track_number": track.track_number,
-        "disc_number": track.disc_number,
-        "duration": track.duration,
-        "year": track.year,
-        "genre": track.genre,
-        "file_path": track.file_path,
-        "stream_url": stream_url,
-        "art_url": art_url,
-        "file_format": track.file_format,
-    }
+    return _sync_response(state.generation, {
+        "since": since,
+        "tracks": tracks,
+        "deleted_track_ids": deleted.scalars().all(),
+        "artists": artists,
+        "albums": albums,
+    })
+
+
+@router.get("/export", dependencies=_CONDITIONAL_GET)
+async def export_library(format: str = Query("ndjson", pattern="^(ndjson|columnar)$")):
+    """Stream every track, with its stream and art URLs.
+
+    ``ndjson`` sends one track object per line. ``columnar`` sends a line
+    naming the columns, then one line per batch of tracks holding an array
+    of values for each column. Tracks are read in batches, so memory use
+    doesn't grow with the library.
+    """
+    headers = generation.cache_headers()
+    filename = "library.ndjson" if format == "ndjson" else "library-columnar.ndjson"
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return StreamingResponse(
+        _export_lines(format == "columnar"), media_type="application/x-ndjson", headers=headers
+    )
+
+
+async def _export_lines(columnar: bool):
+    # Sessions from dependencies are closed before a streamed body is sent,
+    # so each batch opens its own. Paging by ID keeps later batches cheap.
+    columns = None
+    last_id = 0
+    while True:
+        async with read_session() as session:
+            result = await session.execute(
+                select(*TRACK_COLUMNS)
+                .where(Track.id > last_id)
+                .order_by(Track.id)
+                .limit(_EXPORT_BATCH_SIZE)
+            )
+            rows = result.all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+
+        tracks = [track_to_dict(row) for row in rows]
+        if not columnar:
+            yield b"".join(dumps(track) + b"\n" for track in tracks)
+            continue
+        if columns is None:
+            columns = list(tracks[0])
+            yield dumps({"columns": columns}) + b"\n"
+        yield dumps([[track[column] for track in tracks] for column in columns]) + b"\n"
+
+
+# Tracks read and sent per chunk of an export
+_EXPORT_BATCH_SIZE = 1000
+
+
+# Columns sent to sync clients, along with the ``TRACK_COLUMNS``. Art URLs are
+# built from the art columns of tracks, which artists and albums reference by
+# ``art_track_id``.
+_SYNC_ARTIST_COLUMNS = (
+    Artist.name, Artist.track_count, Artist.album_count, Artist.total_duration,
+    Artist.art_track_id,
+)
+_SYNC_ALBUM_COLUMNS = (
+    Album.name, Album.artist, Album.album_artist, Album.track_count, Album.total_duration,
+    Album.year, Album.art_track_id,
+)
+
+
+async def _library_state(session: AsyncSession) -> LibraryState:
+    result = await session.execute(select(LibraryState))
+    state = result.scalar_one_or_none()
+    if state is None:
+        raise HTTPException(status_code=503, detail="Library not loaded yet")
+    return state
+
+
+async def _columns(session: AsyncSession, query) -> dict:
+    """Run ``query`` and return its result as ``{column: [values]}``."""
+    result = await session.execute(query)
+    keys = list(result.keys())
+    rows = result.all()
+    if not rows:
+        return {key: [] for key in keys}
+    return {key: list(values) for key, values in zip(keys, zip(*rows))}
+
+
+def _sync_response(generation_: int, body: dict) -> Response:
+    """Sync payload tagged with the generation it was read at.
+
+    The body is plain JSON already, so it skips FastAPI's encoder, which
+    costs more than the queries for a large library.
+    """
+    body = {"generation": generation_, "stream_base_url": settings.stream_base_url, **body}
+    return library_response(body, generation_)
+
+
+def _paginate(query, sort_keys: tuple, limit: int, offset: int, cursor: Optional[str]):
+    """Order ``query`` by ``sort_keys`` and select the page after ``cursor``.
+
+    The cursor holds the sort key values of the last row already sent, so
+    each page is an index seek rather than an ``OFFSET`` scan. One extra row
+    is fetched to tell whether there is a next page.
+    """
+    if cursor:
+        values = _decode_cursor(cursor, len(sort_keys))
+        # The leading bound is implied by the row comparison, but lets
+        # SQLite seek the index instead of scanning it
+        query = query.where(
+            sort_keys[0] >= values[0],
+            tuple_(*sort_keys) > tuple_(*[literal(v) for v in values]),
+        )
+    return query.order_by(*sort_keys).offset(offset).limit(limit + 1)
+
+
+def _next_cursor(rows: list, limit: int, sort_values) -> Optional[str]:
+    """Cursor for the page after ``rows``, or None if this is the last one."""
+    if len(rows) <= limit:
+        return None
+    encoded = json.dumps(sort_values(rows[limit - 1])).encode()
+    return base64.urlsafe_b64encode(encoded).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, size: int) -> list:
+    """Sort key values from a cursor made by ``_next_cursor``."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        values = None
+    # Every paged sort key is non-null in the rows it pages through
+    if (
+        not isinstance(values, list)
+        or len(values) != size
+        or not all(isinstance(v, (str, int, float)) for v in values)
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def _match_terms(q: str) -> list:
+    """Words of a search query, as the full-text tokenizer would split them."""
+    return re.findall(r"\w+", q)
+
+
+def _search_match(q: str, column: Optional[str] = None):
+    """Full-text condition matching every word of ``q`` as a prefix.
+
+    Words are quoted so FTS5 operators in user input are taken literally.
+    ``column`` restricts the match to one of the indexed columns.
+    """
+    expression = " ".join(f'"{term}"*' for term in _match_terms(q))
+    if column:
+        expression = f"{column} : ({expression})"
+    return literal_column("tracks_fts").op("MATCH")(expression)
@@ -7,11 +7,16 @@ from pydantic import BaseModel
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..models import Playlist, PlaylistEntry, Track, get_session
+from ..models import Playlist, PlaylistEntry, Track, get_read_session, get_session
 from ..config import settings
+from .. import generation
+from ..serializers import PLAYLIST_TRACK_COLUMNS, json_response, playlist_track_to_dict
 
 router = APIRouter()
 
+# Answer GETs with 304 while the library generation is unchanged
+_CONDITIONAL_GET = [Depends(generation.conditional_get)]
+
 
 class CreatePlaylistRequest(BaseModel):
     name: str
@@ -30,8 +35,8 @@ class ReorderRequest(BaseModel):
     track_ids: list[int]
 
 
-@router.get("/")
-async def get_playlists(session: AsyncSession = Depends(get_session)):
+@router.get("/", dependencies=_CONDITIONAL_GET)
+async def get_playlists(session: AsyncSession = Depends(get_read_session)):
     """Get all playlists."""
     result = await session.execute(
         select(Playlist).order_by(Playlist.name)
@@ -69,7 +74,7 @@ async def create_playlist(
         is_user_created=True,
     )
     session.add(playlist)
-    await session.commit()
+    await generation.bump(session)
     await session.refresh(playlist)
 
     return {
@@ -80,8 +85,9 @@ async def create_playlist(
     }
 
 
-@router.get("/{playlist_id}")
-async def get_playlist(playlist_id: int, session: AsyncSession = Depends(get_session)):
+@router.get("/{playlist_id}", dependencies=_CONDITIONAL_GET)
+@json_response
+async def get_playlist(playlist_id: int, session: AsyncSession = Depends(get_read_session)):
     """Get a playlist with its tracks."""
     result = await session.execute(
         select(Playlist).where(Playlist.id == playlist_id)
@@ -91,23 +97,22 @@ async def get_playlist(playlist_id: int, session: AsyncSession = Depends(get_ses
     if not playlist:
         raise HTTPException(status_code=404, detail="Playlist not found")
 
-    # Get entries with tracks
+    # Get entries with their tracks in one query
     entries_result = await session.execute(
-        select(PlaylistEntry)
+        select(
+            PlaylistEntry.position, PlaylistEntry.track_id, PlaylistEntry.track_path,
+            *PLAYLIST_TRACK_COLUMNS,
+        )
+        .outerjoin(Track, Track.id == PlaylistEntry.track_id)
         .where(PlaylistEntry.playlist_id == playlist_id)
         .order_by(PlaylistEntry.position)
     )
-    entries = entries_result.scalars().all()
 
     tracks = []
-    for entry in entries:
+    for entry in entries_result:
         if entry.track_id:
-            track_result = await session.execute(
-                select(Track).where(Track.id == entry.track_id)
-            )
-            track = track_result.scalar_one_or_none()
-            if track:
-                tracks.append(_track_to_dict(track, entry.position))
+            if entry.id is not None:
+                tracks.append(playlist_track_to_dict(entry, entry.position))
         elif entry.track_path:
             # Unresolved track from M3U
             tracks.append({
@@ -144,7 +149,7 @@ async def rename_playlist(
 
     playlist.name = request.name
     playlist.updated_at = datetime.utcnow()
-    await session.commit()
+    await generation.bump(session)
 
     return {"id": playlist.id, "name": playlist.name}
 
@@ -167,7 +172,7 @@ async def delete_playlist(playlist_id: int, session: AsyncSession = Depends(get_
             m3u_path.unlink()
 
     await session.delete(playlist)
-    await session.commit()
+    await generation.bump(session)
 
     return {"status": "deleted"}
 
@@ -189,10 +194,10 @@ async def add_track_to_playlist(
 
     # Verify track exists
     track_result = await session.execute(
-        select(Track).where(Track.id == request.track_id)
+        select(Track.file_path).where(Track.id == request.track_id)
     )
-    track = track_result.scalar_one_or_none()
-    if not track:
+    track_path = track_result.scalar_one_or_none()
+    if track_path is None:
         raise HTTPException(status_code=404, detail="Track not found")
 
     # Get current max position
@@ -209,13 +214,13 @@ async def add_track_to_playlist(
     entry = PlaylistEntry(
         playlist_id=playlist_id,
         track_id=request.track_id,
-        track_path=track.file_path,
+        track_path=track_path,
         position=position,
     )
     session.add(entry)
 
     playlist.updated_at = datetime.utcnow()
-    await session.commit()
+    await generation.bump(session)
 
     return {"status": "added", "position": position}
 
@@ -257,7 +262,7 @@ async def remove_track_from_playlist(
     if playlist:
         playlist.updated_at = datetime.utcnow()
 
-    await session.commit()
+    await generation.bump(session)
 
     return {"status": "removed"}
 
@@ -288,7 +293,7 @@ async def reorder_playlist(
     if playlist:
         playlist.updated_at = datetime.utcnow()
 
-    await session.commit()
+    await generation.bump(session)
 
     return {"status": "reordered"}
 
@@ -307,26 +312,25 @@ async def save_playlist_as_m3u(
     if not playlist:
         raise HTTPException(status_code=404, detail="Playlist not found")
 
-    # Get entries
+    # Get entries with their tracks
     entries_result = await session.execute(
-        select(PlaylistEntry)
+        select(
+            PlaylistEntry.track_id, PlaylistEntry.track_path,
+            Track.file_path, Track.title, Track.artist, Track.duration,
+        )
+        .outerjoin(Track, Track.id == PlaylistEntry.track_id)
         .where(PlaylistEntry.playlist_id == playlist_id)
         .order_by(PlaylistEntry.position)
     )
-    entries = entries_result.scalars().all()
 
     # Create M3U content
     lines = ["#EXTM3U"]
-    for entry in entries:
+    for entry in entries_result:
         if entry.track_id:
-            track_result = await session.execute(
-                select(Track).where(Track.id == entry.track_id)
-            )
-            track = track_result.scalar_one_or_none()
-            if track:
-                duration = int(track.duration) if track.duration else -1
-                lines.append(f"#EXTINF:{duration},{track.artist} - {track.title}")
-                lines.append(track.file_path)
+            if entry.file_path is not None:
+                duration = int(entry.duration) if entry.duration else -1
+                lines.append(f"#EXTINF:{duration},{entry.artist} - {entry.title}")
+                lines.append(entry.file_path)
         elif entry.track_path:
             lines.append(entry.track_path)
 
@@ -342,35 +346,6 @@ async def save_playlist_as_m3u(
 
     # Update playlist record
     playlist.file_path = filename
-    await session.commit()
+    await generation.bump(session)
 
     return {"status": "saved", "file": filename}
-
-
-def _track_to_dict(track: Track, position: int) -> dict:
-    """Convert a track to a dict for playlist display."""
-    from urllib.parse import quote
-
-    # URL-encode the file path (safe='/' keeps path separators)
-    encoded_path = quote(track.file_path, safe='/')
-    stream_url = f"{settings.stream_base_url}/stream/{encoded_path}"
-    art_url = None
-
-    if track.has_embedded_art:
-        art_url = f"{settings.stream_base_url}/stream/art/embedded/{track.id}"
-    elif track.has_folder_art and track.folder_art_path:
-        encoded_art_path = quote(track.folder_art_path, safe='/')
-        art_url = f"{settings.stream_base_url}/stream/art/{encoded_art_path}"
-    else:
-        art_url = "/generic_album.jpg"
-
-    return {
-        "id": track.id,
-        "title": track.title,
-        "artist": track.artist,
-        "album": track.album,
-        "duration": track.duration,
-        "stream_url": stream_url,
-        "art_url": art_url,
-        "position": position,
-    }
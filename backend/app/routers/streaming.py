@@ -1,38 +1,258 @@
 import os
-import mimetypes
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+from functools import partial
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Union
 
+import anyio
 from fastapi import APIRouter, HTTPException, Request, Depends
-from fastapi.responses import FileResponse, Response, StreamingResponse
+from fastapi.responses import JSONResponse, Response
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-import mutagen
-
+from ..art_cache import THUMBNAIL_SIZES, extract_embedded_art, get_art_cache, read_image
 from ..config import settings
-from ..models import Track, get_session
+from ..generation import etag_matches
+from ..mime import get_mime_type
+from ..models import Track, get_read_session
+from ..serializers import file_version
+from .. import stream_paths
 
 router = APIRouter()
 
-# MIME types for supported formats
-MIME_TYPES = {
-    ".mp3": "audio/mpeg",
-    ".m4a": "audio/mp4",
-    ".wav": "audio/wav",
-    ".flac": "audio/flac",
-    ".jpg": "image/jpeg",
-    ".jpeg": "image/jpeg",
-    ".png": "image/png",
-}
+# Cache-Control of responses whose URL changes with their content
+_IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+class FileRangeResponse(Response):
+    """Send ``length`` bytes of a file starting at ``offset``.
+
+    Servers offering the ASGI zero-copy send extension are handed the open
+    file, so the kernel sends it with ``sendfile``. Elsewhere the range is
+    read with ``os.pread`` in large chunks, one thread hop per chunk, and
+    sending stops as soon as the client disconnects. HEAD requests get the
+    headers without the file being opened.
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        offset: int,
+        length: int,
+        status_code: int = 200,
+        media_type: Optional[str] = None,
+        headers: Optional[dict] = None,
+    ):
+        self.path = path
+        self.offset = offset
+        self.length = length
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers({**(headers or {}), "Content-Length": str(length)})
+
+    async def __call__(self, scope, receive, send):
+        if scope["method"] == "HEAD":
+            await send({
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        try:
+            file = await anyio.to_thread.run_sync(open, self.path, "rb")
+        except FileNotFoundError:
+            # Removed since it was looked up
+            response = JSONResponse({"detail": "File not found"}, status_code=404)
+            await response(scope, receive, send)
+            return
+
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            })
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file,
+                    "offset": self.offset,
+                    "count": self.length,
+                    "more_body": False,
+                })
+                return
+
+            async with anyio.create_task_group() as task_group:
+
+                async def wrap(func):
+                    await func()
+                    task_group.cancel_scope.cancel()
+
+                task_group.start_soon(wrap, partial(self._send_range, file.fileno(), send))
+                await wrap(partial(_wait_for_disconnect, receive))
+        finally:
+            file.close()
+
+    async def _send_range(self, fd: int, send):
+        position = self.offset
+        remaining = self.length
+        while remaining > 0:
+            chunk = await anyio.to_thread.run_sync(
+                os.pread, fd, min(self.chunk_size, remaining), position
+            )
+            if not chunk:
+                # The file shrank since it was measured
+                break
+            position += len(chunk)
+            remaining -= len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+@router.api_route("/id/{track_id}", methods=["GET", "HEAD"])
+async def stream_track(track_id: int, request: Request):
+    """Stream a track by ID, with range request support.
+
+    The file's path, size and type come from an in-memory map of the
+    library, so nothing is looked up on disk before the file is opened.
+    """
+    file = await stream_paths.lookup(track_id)
+    if file is None:
+        raise HTTPException(status_code=404, detail="Track not found")
+
+    validators = _validators(file.size, file.mtime, track_id)
+    return _file_response(file.path, file.size, file.mime, request, validators)
+
+
+@router.api_route("/art/embedded/{track_id}", methods=["GET", "HEAD"])
+async def get_embedded_art(
+    track_id: int,
+    request: Request,
+    size: Optional[int] = None,
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Get embedded album art from a track's metadata.
+
+    ``size`` selects one of the ``THUMBNAIL_SIZES`` instead of the original.
+    """
+    result = await session.execute(
+        select(Track.file_path, Track.has_embedded_art, Track.file_size, Track.last_modified)
+        .where(Track.id == track_id)
+    )
+    track = result.one_or_none()
+
+    if not track:
+        raise HTTPException(status_code=404, detail="Track not found")
+
+    if not track.has_embedded_art:
+        raise HTTPException(status_code=404, detail="No embedded art")
+
+    # Validated by the indexed version of the track, so a cached copy is
+    # confirmed without reading the file
+    _check_thumbnail_size(size)
+    mtime = track.last_modified.timestamp() if track.last_modified else None
+    validators = _art_validators(track.file_size or 0, mtime, track_id, size)
+    not_modified = _not_modified(request, validators)
+    if not_modified:
+        return not_modified
+
+    full_path = Path(settings.music_path) / track.file_path
+    version = file_version(track.last_modified)
+    key = (track.file_path, track.file_size or 0, version)
+    art_data, mime_type = await _cached_art(key, full_path, extract_embedded_art, size)
 
+    # Art URLs from the library name the file version, so those can be kept.
+    # Any other version would pin the current art under a URL meant for another.
+    current = request.query_params.get("v") == f"{version:x}"
+    cache_control = _IMMUTABLE if current else "no-cache"
+    headers = {**validators, "Cache-Control": cache_control}
+    return Response(content=art_data, media_type=mime_type, headers=headers)
 
-def get_mime_type(file_path: str) -> str:
-    """Get MIME type for a file."""
-    ext = Path(file_path).suffix.lower()
-    return MIME_TYPES.get(ext, mimetypes.guess_type(file_path)[0] or "application/octet-stream")
 
+@router.api_route("/art/{art_path:path}", methods=["GET", "HEAD"])
+async def get_folder_art(art_path: str, request: Request, size: Optional[int] = None):
+    """Get folder-based album art.
 
-@router.get("/{file_path:path}")
+    ``size`` selects one of the ``THUMBNAIL_SIZES`` instead of the original.
+    """
+    _check_thumbnail_size(size)
+    full_path = Path(settings.music_path) / art_path
+
+    try:
+        full_path = full_path.resolve()
+        if not str(full_path).startswith(str(Path(settings.music_path).resolve())):
+            raise HTTPException(status_code=403, detail="Access denied")
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid path")
+
+    if not full_path.is_file():
+        raise HTTPException(status_code=404, detail="Art not found")
+
+    stat = full_path.stat()
+    validators = _art_validators(stat.st_size, stat.st_mtime, stat.st_ino, size)
+    if size is None:
+        return _file_response(
+            full_path, stat.st_size, get_mime_type(str(full_path)), request, validators
+        )
+
+    not_modified = _not_modified(request, validators)
+    if not_modified:
+        return not_modified
+
+    key = (art_path, stat.st_size, stat.st_mtime_ns // 1000)
+    art_data, mime_type = await _cached_art(key, full_path, read_image, size)
+    return Response(
+        content=art_data, media_type=mime_type, headers={**validators, "Cache-Control": "no-cache"}
+    )
+
+
+def _check_thumbnail_size(size: Optional[int]):
+    if size is not None and size not in THUMBNAIL_SIZES:
+        sizes = ", ".join(str(s) for s in THUMBNAIL_SIZES)
+        raise HTTPException(status_code=400, detail=f"Thumbnail size must be one of {sizes}")
+
+
+def _art_validators(size: int, mtime: Optional[float], file_id: int, thumbnail: Optional[int]):
+    """Validators of a file's art, told apart by thumbnail size and format."""
+    validators = _validators(size, mtime, file_id)
+    if validators and thumbnail:
+        validators["ETag"] = f'{validators["ETag"][:-1]}-{thumbnail}{settings.thumbnail_format}"'
+    return validators
+
+
+async def _cached_art(key: tuple, full_path: Path, extract, size: Optional[int]) -> tuple:
+    """``(data, mime)`` of art or a thumbnail from the art cache, extracting it if needed."""
+    cache = get_art_cache()
+    art = cache.get_cached(key, size)
+    if art is not None:
+        return art
+
+    if not full_path.exists():
+        raise HTTPException(status_code=404, detail="File not found")
+
+    try:
+        art = await anyio.to_thread.run_sync(cache.get, key, full_path, extract, size)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error extracting art: {e}")
+
+    if art is None:
+        raise HTTPException(status_code=404, detail="Could not extract art")
+    return art
+
+
+# Declared last so the routes above aren't taken for file paths
+@router.api_route("/{file_path:path}", methods=["GET", "HEAD"])
 async def stream_file(file_path: str, request: Request):
     """Stream a music file with range request support."""
     # Security: ensure path doesn't escape music directory
@@ -50,147 +270,125 @@ async def stream_file(file_path: str, request: Request):
     if not full_path.is_file():
         raise HTTPException(status_code=400, detail="Not a file")
 
-    file_size = full_path.stat().st_size
+    stat = full_path.stat()
     mime_type = get_mime_type(str(full_path))
+    validators = _validators(stat.st_size, stat.st_mtime, stat.st_ino)
+
+    return _file_response(full_path, stat.st_size, mime_type, request, validators)
+
+
+def _validators(size: int, mtime: Optional[float], file_id: int) -> dict:
+    """Strong ETag and Last-Modified headers for a version of a file.
 
-    # Handle range requests for seeking
+    ``file_id`` tells apart files of the same size and mtime: the inode, or
+    the track ID where only the indexed file version is known. Without an
+    mtime nothing reliable identifies the version, so no validators are sent.
+    """
+    if mtime is None:
+        return {}
+    return {
+        "ETag": f'"{file_id:x}-{size:x}-{int(mtime * 1_000_000):x}"',
+        "Last-Modified": formatdate(mtime, usegmt=True),
+    }
+
+
+def _not_modified(request: Request, validators: dict) -> Optional[Response]:
+    """A 304 response if the client's cached copy is still current."""
+    if not validators:
+        return None
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Takes precedence over If-Modified-Since
+        if not etag_matches(if_none_match, validators["ETag"]):
+            return None
+    else:
+        if_modified_since = _parse_http_date(request.headers.get("if-modified-since"))
+        last_modified = _parse_http_date(validators["Last-Modified"])
+        if if_modified_since is None or last_modified > if_modified_since:
+            return None
+
+    return Response(status_code=304, headers=validators)
+
+
+def _parse_http_date(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _file_response(
+    path, file_size: int, mime_type: str, request: Request, validators: dict
+) -> Response:
+    """The whole file, the range the request asks for, or a 304."""
+    not_modified = _not_modified(request, validators)
+    if not_modified:
+        return not_modified
+
+    headers = {"Accept-Ranges": "bytes", **validators}
+
+    # Handle range requests for seeking, unless If-Range names an older version
     range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and if_range and not _if_range_matches(if_range, validators):
+        range_header = None
 
     if range_header:
-        return _range_response(full_path, file_size, mime_type, range_header)
-
-    return FileResponse(
-        full_path,
-        media_type=mime_type,
-        headers={
-            "Accept-Ranges": "bytes",
-            "Content-Length": str(file_size),
-        },
+        return _range_response(path, file_size, mime_type, range_header, headers)
+
+    return FileRangeResponse(path, 0, file_size, media_type=mime_type, headers=headers)
+
+
+def _if_range_matches(if_range: str, validators: dict) -> bool:
+    """Whether If-Range names the current version: a strong ETag or exact date."""
+    if not validators:
+        return False
+    if if_range.startswith('"'):
+        return if_range == validators["ETag"]
+    if_range_date = _parse_http_date(if_range)
+    return if_range_date is not None and if_range_date == _parse_http_date(
+        validators["Last-Modified"]
     )
 
 
 def _range_response(
-    file_path: Path, file_size: int, mime_type: str, range_header: str
-) -> StreamingResponse:
+    file_path, file_size: int, mime_type: str, range_header: str, headers: dict
+) -> FileRangeResponse:
     """Handle HTTP range requests for seeking support."""
     try:
         range_spec = range_header.replace("bytes=", "")
         start_str, end_str = range_spec.split("-")
 
-        start = int(start_str) if start_str else 0
-        end = int(end_str) if end_str else file_size - 1
+        if start_str:
+            start = int(start_str)
+            end = int(end_str) if end_str else file_size - 1
+        else:
+            # Suffix range: the last end_str bytes
+            start = file_size - int(end_str)
+            end = file_size - 1
 
         # Clamp values
         start = max(0, start)
         end = min(file_size - 1, end)
 
         if start > end:
-            raise HTTPException(status_code=416, detail="Invalid range")
-
-        content_length = end - start + 1
-
-        def iter_file():
-            with open(file_path, "rb") as f:
-                f.seek(start)
-                remaining = content_length
-                chunk_size = 65536  # 64KB chunks
-
-                while remaining > 0:
-                    chunk = f.read(min(chunk_size, remaining))
-                    if not chunk:
-                        break
-                    remaining -= len(chunk)
-                    yield chunk
-
-        return StreamingResponse(
-            iter_file(),
+            raise HTTPException(
+                status_code=416,
+                detail="Invalid range",
+                headers={"Content-Range": f"bytes */{file_size}"},
+            )
+
+        return FileRangeResponse(
+            file_path,
+            start,
+            end - start + 1,
             status_code=206,
             media_type=mime_type,
-            headers={
-                "Accept-Ranges": "bytes",
-                "Content-Range": f"bytes {start}-{end}/{file_size}",
-                "Content-Length": str(content_length),
-            },
+            headers={**headers, "Content-Range": f"bytes {start}-{end}/{file_size}"},
         )
 
     except ValueError:
         raise HTTPException(status_code=416, detail="Invalid range format")
-
-
-@router.get("/art/embedded/{track_id}")
-async def get_embedded_art(track_id: int, session: AsyncSession = Depends(get_session)):
-    """Get embedded album art from a track's metadata."""
-    result = await session.execute(select(Track).where(Track.id == track_id))
-    track = result.scalar_one_or_none()
-
-    if not track:
-        raise HTTPException(status_code=404, detail="Track not found")
-
-    if not track.has_embedded_art:
-        raise HTTPException(status_code=404, detail="No embedded art")
-
-    full_path = Path(settings.music_path) / track.file_path
-
-    if not full_path.exists():
-        raise HTTPException(status_code=404, detail="File not found")
-
-    try:
-        audio = mutagen.File(full_path)
-
-        # Try different tag formats for embedded art
-        art_data = None
-        mime_type = "image/jpeg"
-
-        if hasattr(audio, "pictures") and audio.pictures:
-            # FLAC, OGG
-            art_data = audio.pictures[0].data
-            mime_type = audio.pictures[0].mime
-
-        elif hasattr(audio, "tags"):
-            tags = audio.tags
-
-            # ID3 (MP3)
-            if hasattr(tags, "getall"):
-                apic_frames = tags.getall("APIC")
-                if apic_frames:
-                    art_data = apic_frames[0].data
-                    mime_type = apic_frames[0].mime
-
-            # MP4/M4A
-            elif "covr" in tags:
-                covers = tags["covr"]
-                if covers:
-                    art_data = bytes(covers[0])
-                    # MP4 cover format
-                    if hasattr(covers[0], "imageformat"):
-                        fmt = covers[0].imageformat
-                        if fmt == 13:  # JPEG
-                            mime_type = "image/jpeg"
-                        elif fmt == 14:  # PNG
-                            mime_type = "image/png"
-
-        if not art_data:
-            raise HTTPException(status_code=404, detail="Could not extract art")
-
-        return Response(content=art_data, media_type=mime_type)
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error extracting art: {e}")
-
-
-@router.get("/art/{art_path:path}")
-async def get_folder_art(art_path: str):
-    """Get folder-based album art."""
-    full_path = Path(settings.music_path) / art_path
-
-    try:
-        full_path = full_path.resolve()
-        if not str(full_path).startswith(str(Path(settings.music_path).resolve())):
-            raise HTTPException(status_code=403, detail="Access denied")
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid path")
-
-    if not full_path.exists():
-        raise HTTPException(status_code=404, detail="Art not found")
-
-    return FileResponse(full_path, media_type=get_mime_type(str(full_path)))
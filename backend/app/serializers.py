@@ -0,0 +1,138 @@
+import functools
+from datetime import datetime
+from typing import Optional, Union
+from urllib.parse import quote
+
+import orjson
+from fastapi.responses import ORJSONResponse, Response
+
+from . import generation
+from .config import settings
+from .models import Track
+
+# Widths and heights of the thumbnails rendered for each cover
+THUMBNAIL_SIZES = (150, 300, 600)
+
+# Track columns needed to build the art URL of a representative track
+ART_COLUMNS = (
+    Track.id, Track.has_embedded_art, Track.has_folder_art, Track.folder_art_path,
+    Track.last_modified,
+)
+
+# Columns read by ``track_to_dict``. List endpoints select just these rather
+# than whole Track objects, skipping unused columns and ORM bookkeeping.
+TRACK_COLUMNS = (
+    Track.id, Track.file_path, Track.title, Track.artist, Track.album, Track.album_artist,
+    Track.track_number, Track.disc_number, Track.duration, Track.year, Track.genre,
+    Track.file_format, Track.has_embedded_art, Track.has_folder_art, Track.folder_art_path,
+    Track.last_modified,
+)
+
+# Columns read by ``playlist_track_to_dict``
+PLAYLIST_TRACK_COLUMNS = (
+    Track.id, Track.file_path, Track.title, Track.artist, Track.album, Track.duration,
+    Track.has_embedded_art, Track.has_folder_art, Track.folder_art_path, Track.last_modified,
+)
+
+
+@functools.lru_cache(maxsize=16384)
+def _encode_path(path: str) -> str:
+    # URL-encode the file path (safe='/' keeps path separators)
+    return quote(path, safe='/')
+
+
+def stream_url(file_path: str) -> str:
+    return f"{settings.stream_base_url}/stream/{_encode_path(file_path)}"
+
+
+def file_version(modified: Optional[datetime]) -> int:
+    """Version of a track file as indexed: its mtime in microseconds."""
+    return int(modified.timestamp() * 1_000_000) if modified else 0
+
+
+def art_url(track) -> str:
+    """Art URL for a track, or anything carrying the ``ART_COLUMNS``."""
+    if track.has_embedded_art:
+        # Naming the file version lets clients cache the art for good
+        version = file_version(track.last_modified)
+        return f"{settings.stream_base_url}/stream/art/embedded/{track.id}?v={version:x}"
+    elif track.has_folder_art and track.folder_art_path:
+        return f"{settings.stream_base_url}/stream/art/{_encode_path(track.folder_art_path)}"
+    return "/generic_album.jpg"
+
+
+def art_thumbnails(track) -> dict:
+    """Thumbnail URLs of a track's art by size, empty for the generic art."""
+    url = art_url(track)
+    if url.startswith("/"):
+        return {}
+    separator = "&" if "?" in url else "?"
+    return {str(size): f"{url}{separator}size={size}" for size in THUMBNAIL_SIZES}
+
+
+def track_to_dict(track) -> dict:
+    """Convert a Track, or a row of ``TRACK_COLUMNS``, to a dictionary with stream URLs."""
+    return {
+        "id": track.id,
+        "title": track.title,
+        "artist": track.artist,
+        "album": track.album,
+        "album_artist": track.album_artist,
+        "track_number": track.track_number,
+        "disc_number": track.disc_number,
+        "duration": track.duration,
+        "year": track.year,
+        "genre": track.genre,
+        "file_path": track.file_path,
+        "stream_url": stream_url(track.file_path),
+        "art_url": art_url(track),
+        "art_thumbnails": art_thumbnails(track),
+        "file_format": track.file_format,
+    }
+
+
+def playlist_track_to_dict(track, position: int) -> dict:
+    """Convert a track, or a row of ``PLAYLIST_TRACK_COLUMNS``, for playlist display."""
+    return {
+        "id": track.id,
+        "title": track.title,
+        "artist": track.artist,
+        "album": track.album,
+        "duration": track.duration,
+        "stream_url": stream_url(track.file_path),
+        "art_url": art_url(track),
+        "art_thumbnails": art_thumbnails(track),
+        "position": position,
+    }
+
+
+def dumps(value) -> bytes:
+    return orjson.dumps(value)
+
+
+def json_response(endpoint):
+    """Encode an endpoint's JSON with orjson.
+
+    FastAPI otherwise walks the returned dict through ``jsonable_encoder``
+    before encoding it, which costs more than building it for large pages.
+    """
+
+    @functools.wraps(endpoint)
+    async def wrapper(**kwargs):
+        # Read before the endpoint's queries, so the tag is never newer than the body
+        current = generation.current()
+        return library_response(await endpoint(**kwargs), current)
+
+    return wrapper
+
+
+def library_response(content: Union[dict, bytes], current: Optional[int]) -> Response:
+    """A JSON response tagged with the library generation ``current``.
+
+    ``content`` is the body, or the body already encoded. Returned responses
+    don't pick up the ETag set by route dependencies, so it is set here.
+    """
+    headers = generation.cache_headers(current)
+    if isinstance(content, bytes):
+        return Response(content, media_type="application/json", headers=headers)
+    return ORJSONResponse(content, headers=headers)
@@ -0,0 +1,88 @@
+import asyncio
+import os
+import time
+from typing import NamedTuple, Optional
+
+from sqlalchemy import select
+
+from . import generation
+from .config import settings
+from .mime import get_mime_type
+from .models import DeletedTrack, LibraryState, Track, read_session
+
+
+class StreamFile(NamedTuple):
+    """What streaming a track needs, known without touching the disk."""
+
+    path: str  # Absolute path, checked to be inside the music folder
+    size: int
+    mtime: Optional[float]
+    mime: str
+
+
+# Track ID -> StreamFile for every track in the library
+_files: dict = {}
+# Library generation the map reflects, and the one its rows were read at
+_generation: Optional[int] = None
+_synced: Optional[int] = None
+_lock = asyncio.Lock()
+
+
+async def lookup(track_id: int) -> Optional[StreamFile]:
+    """The file of a track, refreshing the map first if the library changed."""
+    if _generation is None or _generation != generation.current():
+        await refresh()
+    return _files.get(track_id)
+
+
+async def refresh():
+    """Bring the map up to date with the tracks table.
+
+    The first call loads every track. Later ones read only the tracks
+    written or deleted since, by their delta sync stamps, so a change
+    costs one indexed query rather than a reload.
+    """
+    global _generation, _synced
+    async with _lock:
+        current = generation.current()
+        if _generation is not None and _generation == current:
+            return
+
+        started = time.perf_counter()
+        async with read_session() as session:
+            # Read first, so rows changing meanwhile are read again next time
+            synced = (await session.execute(select(LibraryState.generation))).scalar()
+
+            query = select(Track.id, Track.file_path, Track.file_size, Track.last_modified)
+            deleted = []
+            if _synced is not None:
+                query = query.where(Track.sync_generation > _synced)
+                deleted = (await session.execute(
+                    select(DeletedTrack.track_id).where(DeletedTrack.sync_generation > _synced)
+                )).scalars().all()
+            rows = (await session.execute(query)).all()
+
+        for track_id in deleted:
+            _files.pop(track_id, None)
+        _add_files(rows)
+
+        if _synced is None:
+            print(
+                f"Stream path map loaded: {len(_files)} tracks "
+                f"in {time.perf_counter() - started:.1f}s"
+            )
+        _generation = current
+        _synced = synced
+
+
+def _add_files(rows):
+    # Paths come from the indexer's walk of the music folder. Checking them
+    # here, lexically, spares each request resolving the path on disk.
+    root = os.path.realpath(settings.music_path)
+    for track_id, file_path, size, modified in rows:
+        path = os.path.normpath(os.path.join(root, file_path))
+        if not path.startswith(root + os.sep):
+            _files.pop(track_id, None)
+            continue
+        mtime = modified.timestamp() if modified else None
+        _files[track_id] = StreamFile(path, size or 0, mtime, get_mime_type(path))
@@ -0,0 +1,71 @@
+import json
+import sqlite3
+from pathlib import Path
+
+
+class TagCache:
+    """Parsed tags stored on disk, keyed by (device, inode, size, mtime_ns).
+
+    Kept in its own database next to library.db, so a rebuilt library can be
+    re-populated without re-reading unchanged files. Only tag-derived fields
+    are cached; anything that depends on the file's path is recomputed.
+    There is one entry per inode, replaced when the file changes.
+    """
+
+    # Bump when tag extraction changes so stale results are discarded
+    VERSION = 2
+
+    def __init__(self, path: Path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != self.VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS tags")
+            self.conn.execute(f"PRAGMA user_version = {self.VERSION}")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tags (
+                dev INTEGER NOT NULL,
+                ino INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                tags TEXT NOT NULL,
+                PRIMARY KEY (dev, ino)
+            ) WITHOUT ROWID
+            """
+        )
+
+    def get_many(self, keys: list, chunk_size: int = 500) -> dict:
+        """Look up cached tags, returning ``{key: tags}`` for the hits."""
+        hits = {}
+        wanted = set(keys)
+        by_dev = {}
+        for dev, ino, size, mtime_ns in wanted:
+            by_dev.setdefault(dev, []).append(ino)
+
+        for dev, inodes in by_dev.items():
+            for i in range(0, len(inodes), chunk_size):
+                chunk = inodes[i:i + chunk_size]
+                rows = self.conn.execute(
+                    f"SELECT ino, size, mtime_ns, tags FROM tags "
+                    f"WHERE dev = ? AND ino IN ({','.join('?' * len(chunk))})",
+                    [dev, *chunk],
+                )
+                for ino, size, mtime_ns, tags in rows:
+                    key = (dev, ino, size, mtime_ns)
+                    if key in wanted:
+                        hits[key] = json.loads(tags)
+        return hits
+
+    def put_many(self, items: list):
+        """Store ``(key, tags)`` pairs."""
+        if not items:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO tags (dev, ino, size, mtime_ns, tags) VALUES (?, ?, ?, ?, ?)",
+                [(*key, json.dumps(tags)) for key, tags in items],
+            )
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,209 @@
+# Tag extraction, kept free of database/settings imports so indexer
+# worker processes can load it cheaply.
+import hashlib
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import mutagen
+
+
+def read_tags(file_path: str) -> Optional[dict]:
+    """Read the tag-derived fields of an audio file.
+
+    This runs in indexer worker processes, so it takes and returns plain
+    picklable (and JSON-serializable) values rather than ORM objects.
+    Returns None if the file can't be parsed.
+    """
+    file_path = Path(file_path)
+    try:
+        audio = mutagen.File(file_path)
+
+        if audio is None:
+            return None
+
+        # Extract metadata
+        title = None
+        artist = None
+        album = None
+        album_artist = None
+        track_number = None
+        disc_number = None
+        duration = None
+        year = None
+        genre = None
+        has_embedded_art = False
+
+        if audio:
+            duration = audio.info.length if hasattr(audio.info, "length") else None
+
+            tags = audio.tags if hasattr(audio, "tags") else audio
+
+            if tags:
+                # Try different tag formats
+                title = _get_tag(tags, ["TIT2", "title", "\xa9nam", "Title"])
+                artist = _get_tag(tags, ["TPE1", "artist", "\xa9ART", "Artist"])
+                album = _get_tag(tags, ["TALB", "album", "\xa9alb", "Album"])
+                album_artist = _get_tag(tags, ["TPE2", "albumartist", "aART"])
+                genre = _get_tag(tags, ["TCON", "genre", "\xa9gen", "Genre"])
+
+                # Track number
+                track_str = _get_tag(tags, ["TRCK", "tracknumber", "trkn"])
+                if track_str:
+                    if isinstance(track_str, tuple):
+                        track_number = track_str[0]
+                    elif "/" in str(track_str):
+                        track_number = int(str(track_str).split("/")[0])
+                    else:
+                        try:
+                            track_number = int(track_str)
+                        except (ValueError, TypeError):
+                            pass
+
+                # Disc number
+                disc_str = _get_tag(tags, ["TPOS", "discnumber", "disk"])
+                if disc_str:
+                    if isinstance(disc_str, tuple):
+                        disc_number = disc_str[0]
+                    elif "/" in str(disc_str):
+                        disc_number = int(str(disc_str).split("/")[0])
+                    else:
+                        try:
+                            disc_number = int(disc_str)
+                        except (ValueError, TypeError):
+                            pass
+
+                # Year
+                year_str = _get_tag(tags, ["TDRC", "date", "\xa9day", "Year"])
+                if year_str:
+                    try:
+                        year = int(str(year_str)[:4])
+                    except (ValueError, TypeError):
+                        pass
+
+                # Check for embedded art
+                has_embedded_art = _has_embedded_art(audio, tags)
+
+        return dict(
+            fingerprint=file_fingerprint(file_path),
+            title=title,
+            artist=artist,
+            album=album,
+            album_artist=album_artist,
+            track_number=track_number,
+            disc_number=disc_number,
+            duration=duration,
+            year=year,
+            genre=genre,
+            has_embedded_art=has_embedded_art,
+        )
+
+    except Exception as e:
+        print(f"Error processing {file_path}: {e}")
+        return None
+
+
+def file_fingerprint(file_path, chunk_size: int = 65536) -> str:
+    """Hash a file's size with its first and last 64KB.
+
+    Cheap enough to compute for every file, and stable across renames and
+    moves, so a vanished track can be matched to the file it became.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        digest.update(size.to_bytes(8, "little"))
+        f.seek(0)
+        digest.update(f.read(chunk_size))
+        if size > chunk_size:
+            f.seek(max(chunk_size, size - chunk_size))
+            digest.update(f.read(chunk_size))
+    return digest.hexdigest()
+
+
+def track_values(
+    tags: dict, rel_path: str, folder_art: Optional[str], file_size: int, mtime: float
+) -> dict:
+    """Combine tag fields with path-based fallbacks and file info into track
+    column values."""
+    path = Path(rel_path)
+    title = tags["title"]
+    artist = tags["artist"]
+    album = tags["album"]
+
+    # Fallback to path-based metadata
+    if not title:
+        title = path.stem
+
+    if not artist or not album:
+        path_parts = path.parts
+        if len(path_parts) >= 3:
+            # Artist/Album/Track structure
+            if not artist:
+                artist = path_parts[-3]
+            if not album:
+                album = path_parts[-2]
+        elif len(path_parts) >= 2:
+            # Artist/Track structure
+            if not artist:
+                artist = path_parts[-2]
+
+    return dict(
+        tags,
+        file_path=rel_path,
+        title=title,
+        artist=artist,
+        album=album,
+        has_folder_art=folder_art is not None,
+        folder_art_path=folder_art,
+        file_size=file_size,
+        file_format=path.suffix.lower().lstrip("."),
+        last_modified=datetime.fromtimestamp(mtime),
+    )
+
+
+def _get_tag(tags, keys: list) -> Optional[str]:
+    """Get a tag value trying multiple key names."""
+    for key in keys:
+        try:
+            if hasattr(tags, "get"):
+                val = tags.get(key)
+            elif hasattr(tags, "__getitem__"):
+                try:
+                    val = tags[key]
+                except (KeyError, IndexError):
+                    continue
+            else:
+                continue
+
+            if val:
+                if isinstance(val, list):
+                    val = val[0]
+                if hasattr(val, "text"):
+                    return str(val.text[0]) if val.text else None
+                return str(val)
+        except Exception:
+            continue
+    return None
+
+
+def _has_embedded_art(audio, tags) -> bool:
+    """Check if audio file has embedded album art."""
+    try:
+        # FLAC, OGG
+        if hasattr(audio, "pictures") and audio.pictures:
+            return True
+
+        # ID3 (MP3)
+        if hasattr(tags, "getall"):
+            if tags.getall("APIC"):
+                return True
+
+        # MP4/M4A
+        if tags and "covr" in tags:
+            return True
+
+        return False
+    except Exception:
+        return False
@@ -0,0 +1,74 @@
+import asyncio
+import os
+from pathlib import Path
+
+from watchfiles import awatch
+
+from . import art_cache, fuzzy_search
+from .config import settings
+from .library import (
+    AUDIO_EXTENSIONS,
+    PLAYLIST_EXTENSIONS,
+    ART_FILENAMES,
+    apply_changes,
+    index_lock,
+)
+from .models import async_session
+
+
+async def watch_library(stop_event: asyncio.Event):
+    """Watch the music folder and apply changes to the library as they happen.
+
+    Uses inotify where available. If it can't be set up (e.g. the watch limit
+    is reached on a very large library) the watcher falls back to polling.
+    """
+    music_path = Path(settings.music_path)
+    force_polling = settings.watch_force_polling
+
+    while not stop_event.is_set():
+        mode = "polling" if force_polling else "inotify"
+        print(f"Watching {music_path} for changes ({mode})")
+        try:
+            async for changes in awatch(
+                music_path,
+                watch_filter=_is_relevant,
+                debounce=settings.watch_debounce_ms,
+                stop_event=stop_event,
+                force_polling=force_polling,
+                poll_delay_ms=settings.watch_poll_interval_ms,
+                ignore_permission_denied=True,
+            ):
+                await _apply(changes)
+            return
+        except OSError as e:
+            if force_polling:
+                print(f"Library watcher stopped: {e}")
+                return
+            print(f"Could not watch with inotify ({e}), falling back to polling")
+            force_polling = True
+
+
+async def _apply(changes: set):
+    """Apply one debounced batch of changes, waiting out any running index."""
+    paths = {path for _, path in changes}
+    try:
+        async with index_lock, async_session() as session:
+            changes = await apply_changes(session, paths)
+        fuzzy_search.schedule_rebuild(changes)
+        art_cache.schedule_thumbnails(changes)
+    except Exception as e:
+        print(f"Error applying library changes: {e}")
+
+
+def _is_relevant(change, path: str) -> bool:
+    """Only react to files the indexer cares about, and to directories."""
+    name = os.path.basename(path)
+    if name.startswith("."):
+        return False
+
+    ext = os.path.splitext(name)[1].lower()
+    if ext in AUDIO_EXTENSIONS or ext in PLAYLIST_EXTENSIONS or name in ART_FILENAMES:
+        return True
+
+    # Directories, and deleted paths that may have been directories
+    return not os.path.isfile(path)
@@ -0,0 +1,176 @@
+"""Benchmark library indexing against synthetic libraries.
+
+Each scale runs in its own process so settings, the database engine and
+peak RSS are isolated:
+
+    python -m benchmarks.index_benchmark --tracks 1000 10000 100000
+
+Reports files/sec for a fresh index, time until the first track is
+browsable, peak RSS of the server process and of the parser workers, the
+size of library.db, and the time of an incremental rescan with no changes.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from .synthetic_library import generate_library
+
+
+def run_scale(tracks: int, workdir: Path, playlists: int, keep: bool) -> dict:
+    """Generate (or reuse) a library of ``tracks`` tracks and index it in a child process."""
+    library = workdir / f"library-{tracks}"
+    data = workdir / f"data-{tracks}"
+
+    if not (keep and library.exists()):
+        started = time.perf_counter()
+        counts = generate_library(library, tracks=tracks, playlists=playlists)
+        print(f"  generated {counts['tracks']} tracks in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    # Always index into a fresh database
+    data.mkdir(parents=True, exist_ok=True)
+    for name in ("library.db", "library.db-wal", "library.db-shm"):
+        (data / name).unlink(missing_ok=True)
+
+    # Without the tag cache, so reruns over a kept library still measure parsing
+    env = dict(
+        os.environ,
+        MUSIC_PATH=str(library), DATA_PATH=str(data), HOST_IP="127.0.0.1", TAG_CACHE="false",
+    )
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.index_benchmark", "--child"],
+        env=env,
+        cwd=Path(__file__).resolve().parent.parent,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["tracks"] = tracks
+    return result
+
+
+def run_child() -> dict:
+    """Index the library named by MUSIC_PATH and measure it."""
+    import asyncio
+    import resource
+
+    from sqlalchemy import func, select
+
+    from app.config import settings
+    from app.library import start_background_index
+    from app.models import Album, IndexStatus, Track, async_session, init_db, read_session
+
+    async def first_browsable(started: float, done: asyncio.Event):
+        """Poll until an album is listed, as the browse pages read them.
+
+        Polls through the read pool, so the probe doesn't hold the single
+        writer connection the indexer is timed on.
+        """
+        while not done.is_set():
+            async with read_session() as session:
+                result = await session.execute(select(Album.id).limit(1))
+                if result.first():
+                    return time.perf_counter() - started
+            await asyncio.sleep(0.01)
+        return None
+
+    async def index_once() -> float:
+        started = time.perf_counter()
+        await start_background_index(force=True)
+        return time.perf_counter() - started
+
+    async def main():
+        await init_db()
+
+        done = asyncio.Event()
+        started = time.perf_counter()
+        probe = asyncio.create_task(first_browsable(started, done))
+        await start_background_index(force=True)
+        elapsed = time.perf_counter() - started
+        done.set()
+        first_track = await probe
+
+        async with async_session() as session:
+            track_count = (await session.execute(select(func.count(Track.id)))).scalar()
+            status = (await session.execute(
+                select(IndexStatus).order_by(IndexStatus.id.desc()).limit(1)
+            )).scalar_one()
+
+        rescan = await index_once()
+        return elapsed, first_track, track_count, status.processed_files, rescan
+
+    elapsed, first_track, track_count, files, rescan = asyncio.run(main())
+
+    db_path = Path(settings.data_path) / "library.db"
+    db_size = sum(
+        p.stat().st_size for p in db_path.parent.glob("library.db*") if p.is_file()
+    )
+    # ru_maxrss is in KiB on Linux
+    return {
+        "files": files,
+        "indexed_tracks": track_count,
+        "elapsed": elapsed,
+        "files_per_sec": files / elapsed if elapsed else 0,
+        "first_track": first_track,
+        "rescan": rescan,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "worker_peak_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+        "db_size_mb": db_size / (1024 * 1024),
+    }
+
+
+def print_table(results: list):
+    header = (
+        f"{'tracks':>8} {'files/s':>9} {'index':>8} {'1st track':>9} "
+        f"{'rescan':>8} {'RSS MB':>7} {'wkr MB':>7} {'DB MB':>7}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        first = f"{r['first_track']:.2f}s" if r["first_track"] is not None else "-"
+        print(
+            f"{r['tracks']:>8} {r['files_per_sec']:>9.0f} {r['elapsed']:>7.2f}s {first:>9} "
+            f"{r['rescan']:>7.2f}s {r['peak_rss_mb']:>7.1f} {r['worker_peak_rss_mb']:>7.1f} "
+            f"{r['db_size_mb']:>7.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark library indexing.")
+    parser.add_argument("--tracks", type=int, nargs="+", default=[1000, 10000],
+                        help="Library sizes to benchmark")
+    parser.add_argument("--playlists", type=int, default=None,
+                        help="Playlists per library (default: one per 200 tracks)")
+    parser.add_argument("--workdir", type=Path,
+                        help="Where to put generated libraries (default: a temporary directory)")
+    parser.add_argument("--keep", action="store_true",
+                        help="Reuse libraries already generated in --workdir")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child()))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="index-bench-") as tmp:
+        workdir = args.workdir or Path(tmp)
+        results = []
+        for tracks in args.tracks:
+            print(f"Benchmarking {tracks} tracks...", file=sys.stderr)
+            playlists = args.playlists if args.playlists is not None else max(1, tracks // 200)
+            results.append(run_scale(tracks, workdir, playlists, args.keep))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Benchmark serializing track pages for the list endpoints.
+
+Fills a throwaway database with synthetic track rows, then compares loading
+a page as whole ORM objects encoded by FastAPI with loading only the needed
+columns encoded by orjson, and times the endpoints themselves:
+
+    python -m benchmarks.serialize_benchmark --tracks 100000 --page 500
+
+Reports the mean time per page and the bytes allocated while building it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+WORDS = ["Blue", "Night", "River", "Electric", "Golden", "Silent", "Wild", "Paper"]
+
+
+async def fill_database(tracks: int):
+    from sqlalchemy import insert
+
+    from app import generation
+    from app.library import refresh_browse_tables
+    from app.models import Track, async_session, init_db
+
+    await init_db()
+    await generation.load()
+    rows = [
+        {
+            "file_path": f"Artist {i // 30}/Album {i // 10}/{i % 10 + 1:02d} {WORDS[i % 8]} Song.flac",
+            "title": f"{WORDS[i % 8]} {WORDS[i // 8 % 8]} {i}",
+            "artist": f"Artist {i // 30}",
+            "album": f"Album {i // 10}",
+            "album_artist": f"Artist {i // 30}",
+            "track_number": i % 10 + 1,
+            "disc_number": 1,
+            "duration": 200.0,
+            "year": 1970 + i % 50,
+            "genre": "Rock",
+            "has_embedded_art": i % 3 == 0,
+            "has_folder_art": i % 3 == 1,
+            "folder_art_path": f"Artist {i // 30}/Album {i // 10}/cover.png",
+            "file_size": 5_000_000,
+            "file_format": "flac",
+        }
+        for i in range(tracks)
+    ]
+    async with async_session() as session:
+        for start in range(0, tracks, 10000):
+            await session.execute(insert(Track), rows[start:start + 10000])
+        await refresh_browse_tables(session)
+        await generation.bump(session)
+
+
+async def orm_page(page: int) -> bytes:
+    """A page the way the list endpoints built it before row projections."""
+    from fastapi.encoders import jsonable_encoder
+    from sqlalchemy import select
+
+    from app.models import TRACK_SORT_KEYS, Track, read_session
+    from app.serializers import track_to_dict
+
+    async with read_session() as session:
+        result = await session.execute(select(Track).order_by(*TRACK_SORT_KEYS).limit(page))
+        tracks = result.scalars().all()
+    body = {"tracks": [track_to_dict(t) for t in tracks]}
+    return json.dumps(jsonable_encoder(body), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+async def row_page(page: int) -> bytes:
+    """A page as the list endpoints build it now."""
+    from sqlalchemy import select
+
+    from app.models import TRACK_SORT_KEYS, read_session
+    from app.serializers import TRACK_COLUMNS, dumps, track_to_dict
+
+    async with read_session() as session:
+        result = await session.execute(
+            select(*TRACK_COLUMNS).order_by(*TRACK_SORT_KEYS).limit(page)
+        )
+        tracks = result.all()
+    return dumps({"tracks": [track_to_dict(t) for t in tracks]})
+
+
+async def measure(build, repeat: int) -> dict:
+    """Mean seconds per call of ``build`` and bytes allocated by one call."""
+    for _ in range(3):
+        await build()
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await build()
+    elapsed = (time.perf_counter() - started) / repeat
+
+    tracemalloc.start()
+    await build()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"ms": elapsed * 1000, "peak_kb": peak / 1024}
+
+
+async def run(tracks: int, page: int, repeat: int) -> list:
+    import httpx
+
+    from app.main import app
+
+    await fill_database(tracks)
+    results = [
+        {"case": "ORM objects + jsonable_encoder", **await measure(lambda: orm_page(page), repeat)},
+        {"case": "row projection + orjson", **await measure(lambda: row_page(page), repeat)},
+    ]
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for url in (
+            f"/api/library/tracks?limit={page}",
+            "/api/library/albums/Album 1/tracks",
+            "/api/library/search?q=golden&limit=100",
+        ):
+            async def get(url=url):
+                response = await client.get(url)
+                response.raise_for_status()
+            results.append({"case": f"GET {url}", **await measure(get, repeat)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark track page serialization.")
+    parser.add_argument("--tracks", type=int, default=100000, help="Tracks in the database")
+    parser.add_argument("--page", type=int, default=500, help="Tracks per page")
+    parser.add_argument("--repeat", type=int, default=50, help="Timed calls per case")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="serialize-bench-") as tmp:
+        # Settings are read on import, so point them at the scratch database first
+        os.environ.update(MUSIC_PATH=tmp, DATA_PATH=tmp, HOST_IP="127.0.0.1")
+        print(f"Benchmarking {args.page}-track pages of {args.tracks} tracks...", file=sys.stderr)
+        results = asyncio.run(run(args.tracks, args.page, args.repeat))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    width = max(len(r["case"]) for r in results)
+    print(f"{'case':<{width}} {'ms':>8} {'peak KB':>9}")
+    print("-" * (width + 19))
+    for r in results:
+        print(f"{r['case']:<{width}} {r['ms']:>8.2f} {r['peak_kb']:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
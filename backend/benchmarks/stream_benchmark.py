@@ -0,0 +1,195 @@
+"""Benchmark audio streaming throughput and server CPU.
+
+Runs the streaming router under uvicorn in a child process, next to a copy
+of the generator-based range response it replaced, and downloads a large
+file from several concurrent clients:
+
+    python -m benchmarks.stream_benchmark --concurrency 1 6 24 --seconds 5
+
+Reports throughput and the server CPU time spent per GB sent, the figure
+that matters on a low-power NAS.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+FILE_NAME = "bench.flac"
+
+# Ranged requests as Sonos sends them when resuming, and plain requests
+CASES = {
+    "generator, ranged": ("/legacy/", {"Range": "bytes=1024-"}),
+    "FileResponse, plain": ("/legacy-plain/", {}),
+    "FileRangeResponse, ranged": ("/stream/", {"Range": "bytes=1024-"}),
+    "FileRangeResponse, plain": ("/stream/", {}),
+}
+
+
+def create_app():
+    """The streaming router plus the responses it replaced, for comparison."""
+    from fastapi import FastAPI, Request
+    from fastapi.responses import FileResponse, StreamingResponse
+
+    from app.config import settings
+    from app.routers import streaming
+
+    app = FastAPI()
+    app.include_router(streaming.router, prefix="/stream")
+
+    @app.get("/legacy/{file_path:path}")
+    async def legacy_range(file_path: str, request: Request):
+        path = Path(settings.music_path) / file_path
+        file_size = path.stat().st_size
+        start = int(request.headers["range"].removeprefix("bytes=").split("-")[0])
+        content_length = file_size - start
+
+        def iter_file():
+            with open(path, "rb") as f:
+                f.seek(start)
+                remaining = content_length
+                while remaining > 0:
+                    chunk = f.read(min(65536, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+
+        return StreamingResponse(
+            iter_file(),
+            status_code=206,
+            media_type="audio/flac",
+            headers={
+                "Content-Range": f"bytes {start}-{file_size - 1}/{file_size}",
+                "Content-Length": str(content_length),
+            },
+        )
+
+    @app.get("/legacy-plain/{file_path:path}")
+    async def legacy_plain(file_path: str):
+        return FileResponse(Path(settings.music_path) / file_path, media_type="audio/flac")
+
+    @app.get("/cpu")
+    async def cpu():
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return {"cpu": usage.ru_utime + usage.ru_stime}
+
+    return app
+
+
+def run_server(port: int):
+    import uvicorn
+
+    uvicorn.run(create_app(), host="127.0.0.1", port=port, log_level="warning")
+
+
+async def measure(base_url: str, case: str, concurrency: int, seconds: float) -> dict:
+    import httpx
+
+    prefix, headers = CASES[case]
+    url = f"{base_url}{prefix}{FILE_NAME}"
+    received = 0
+
+    async def client(http):
+        nonlocal received
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            async with http.stream("GET", url, headers=headers) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_raw(1024 * 1024):
+                    received += len(chunk)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as http:
+        cpu_before = (await http.get(f"{base_url}/cpu")).json()["cpu"]
+        started = time.perf_counter()
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        cpu_after = (await http.get(f"{base_url}/cpu")).json()["cpu"]
+
+    gigabytes = received / 1024 ** 3
+    return {
+        "case": case,
+        "concurrency": concurrency,
+        "mb_per_sec": received / 1024 ** 2 / elapsed,
+        "cpu_sec_per_gb": (cpu_after - cpu_before) / gigabytes if gigabytes else 0,
+    }
+
+
+def wait_for_port(port: int, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("Benchmark server did not start")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark audio streaming.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 6, 24],
+                        help="Concurrent clients to benchmark")
+    parser.add_argument("--seconds", type=float, default=5, help="Duration of each run")
+    parser.add_argument("--size-mb", type=int, default=50, help="Size of the streamed file")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        run_server(args.serve)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="stream-bench-") as tmp:
+        with open(Path(tmp) / FILE_NAME, "wb") as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1024 * 1024))
+
+        port = free_port()
+        env = dict(os.environ, MUSIC_PATH=tmp, DATA_PATH=tmp, HOST_IP="127.0.0.1")
+        server = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.stream_benchmark", "--serve", str(port)],
+            env=env,
+            cwd=Path(__file__).resolve().parent.parent,
+        )
+        try:
+            wait_for_port(port)
+            results = []
+            for concurrency in args.concurrency:
+                for case in CASES:
+                    print(f"Benchmarking {case} x{concurrency}...", file=sys.stderr)
+                    results.append(asyncio.run(
+                        measure(f"http://127.0.0.1:{port}", case, concurrency, args.seconds)
+                    ))
+        finally:
+            server.terminate()
+            server.wait()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'case':<26} {'clients':>7} {'MB/s':>8} {'CPU s/GB':>9}")
+    print("-" * 53)
+    for r in results:
+        print(
+            f"{r['case']:<26} {r['concurrency']:>7} {r['mb_per_sec']:>8.0f} "
+            f"{r['cpu_sec_per_gb']:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
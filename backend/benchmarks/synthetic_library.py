@@ -0,0 +1,277 @@
+"""Generate a synthetic music library for benchmarks.
+
+Files are tiny but carry real tags (and sometimes embedded art), so mutagen
+parses them the same way it parses real rips.
+
+    python -m benchmarks.synthetic_library /tmp/music --tracks 10000
+"""
+import argparse
+import random
+import struct
+import zlib
+from pathlib import Path
+
+from mutagen.flac import FLAC, Picture
+from mutagen.id3 import ID3, APIC, TALB, TCON, TDRC, TIT2, TPE1, TPE2, TPOS, TRCK
+from mutagen.mp4 import MP4, MP4Cover
+from mutagen.wave import WAVE
+
+FORMATS = ("mp3", "flac", "m4a", "wav")
+GENRES = ["Rock", "Jazz", "Classical", "Electronic", "Hip-Hop", "Folk", "Pop", "Soul"]
+WORDS = [
+    "Blue", "Night", "River", "Electric", "Golden", "Silent", "Wild", "Paper",
+    "Summer", "Glass", "Echo", "Velvet", "Stone", "Midnight", "Northern", "Lights",
+    "Heart", "Road", "Fire", "Ocean", "Garden", "Shadow", "Radio", "Dream",
+]
+
+# One MPEG-1 Layer III frame header (128kbps, 44.1kHz) padded to frame length
+MP3_FRAME = b"\xff\xfb\x90\x64" + b"\x00" * 413
+DURATION = 200  # Seconds reported by FLAC and M4A headers
+
+
+def generate_library(
+    root: Path,
+    tracks: int = 1000,
+    tracks_per_album: int = 10,
+    albums_per_artist: int = 3,
+    playlists: int = 10,
+    playlist_size: int = 50,
+    formats: tuple = FORMATS,
+    art_ratio: float = 0.3,
+    art_size: int = 600,
+    seed: int = 0,
+) -> dict:
+    """Write a tagged Artist/Album/Track tree plus M3U playlists under ``root``.
+
+    Roughly ``art_ratio`` of albums get embedded art and the same share get a
+    ``cover.png`` folder image. Returns counts of what was written.
+    """
+    rng = random.Random(seed)
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    art = _png(art_size, art_size, (rng.randrange(256), 90, 160))
+
+    paths = []
+    album_count = 0
+    artist_index = 0
+    while len(paths) < tracks:
+        artist = f"{_words(rng, 2)} {artist_index}"
+        artist_index += 1
+
+        for album_index in range(albums_per_artist):
+            if len(paths) >= tracks:
+                break
+            album = f"{_words(rng, 3)} {album_index}"
+            album_dir = root / _safe(artist) / _safe(album)
+            album_dir.mkdir(parents=True, exist_ok=True)
+            album_count += 1
+
+            fmt = formats[album_count % len(formats)]
+            embedded = art if rng.random() < art_ratio else None
+            if rng.random() < art_ratio:
+                (album_dir / "cover.png").write_bytes(art)
+
+            tags = {
+                "artist": artist,
+                "album": album,
+                "album_artist": artist,
+                "genre": rng.choice(GENRES),
+                "year": str(rng.randint(1960, 2024)),
+            }
+            for number in range(1, tracks_per_album + 1):
+                if len(paths) >= tracks:
+                    break
+                title = _words(rng, rng.randint(1, 4))
+                path = album_dir / f"{number:02d} {_safe(title)}.{fmt}"
+                WRITERS[fmt](path, dict(tags, title=title, track=str(number), disc="1"), embedded)
+                paths.append(path)
+
+    playlist_dir = root / "Playlists"
+    playlist_dir.mkdir(exist_ok=True)
+    for index in range(playlists):
+        entries = rng.sample(paths, min(playlist_size, len(paths)))
+        lines = ["#EXTM3U"]
+        for path in entries:
+            lines.append(f"#EXTINF:{DURATION},{path.stem}")
+            lines.append(str(Path("..") / path.relative_to(root)))
+        # A few entries that won't resolve, as in real exported playlists
+        lines.append("../Missing Artist/Missing Album/01 Gone.mp3")
+        (playlist_dir / f"Playlist {index:04d}.m3u").write_text("\n".join(lines), encoding="utf-8")
+
+    return {"tracks": len(paths), "albums": album_count, "artists": artist_index, "playlists": playlists}
+
+
+def _write_mp3(path: Path, tags: dict, art: bytes = None):
+    path.write_bytes(MP3_FRAME * 20)
+    id3 = ID3()
+    id3.add(TIT2(encoding=3, text=tags["title"]))
+    id3.add(TPE1(encoding=3, text=tags["artist"]))
+    id3.add(TALB(encoding=3, text=tags["album"]))
+    id3.add(TPE2(encoding=3, text=tags["album_artist"]))
+    id3.add(TCON(encoding=3, text=tags["genre"]))
+    id3.add(TDRC(encoding=3, text=tags["year"]))
+    id3.add(TRCK(encoding=3, text=tags["track"]))
+    id3.add(TPOS(encoding=3, text=tags["disc"]))
+    if art:
+        id3.add(APIC(encoding=3, mime="image/png", type=3, desc="Cover", data=art))
+    id3.save(path)
+
+
+def _write_flac(path: Path, tags: dict, art: bytes = None):
+    rate, channels, bits = 44100, 2, 16
+    info = struct.pack(">HH", 4096, 4096) + b"\x00" * 6
+    info += ((rate << 44) | ((channels - 1) << 41) | ((bits - 1) << 36) | (rate * DURATION)).to_bytes(8, "big")
+    info += b"\x00" * 16  # MD5
+    path.write_bytes(b"fLaC" + b"\x80" + len(info).to_bytes(3, "big") + info)
+
+    flac = FLAC(path)
+    flac["title"] = tags["title"]
+    flac["artist"] = tags["artist"]
+    flac["album"] = tags["album"]
+    flac["albumartist"] = tags["album_artist"]
+    flac["genre"] = tags["genre"]
+    flac["date"] = tags["year"]
+    flac["tracknumber"] = tags["track"]
+    flac["discnumber"] = tags["disc"]
+    if art:
+        picture = Picture()
+        picture.type = 3
+        picture.mime = "image/png"
+        picture.data = art
+        flac.add_picture(picture)
+    flac.save()
+
+
+def _write_m4a(path: Path, tags: dict, art: bytes = None):
+    path.write_bytes(_M4A_TEMPLATE)
+    mp4 = MP4(path)
+    mp4["\xa9nam"] = [tags["title"]]
+    mp4["\xa9ART"] = [tags["artist"]]
+    mp4["\xa9alb"] = [tags["album"]]
+    mp4["aART"] = [tags["album_artist"]]
+    mp4["\xa9gen"] = [tags["genre"]]
+    mp4["\xa9day"] = [tags["year"]]
+    mp4["trkn"] = [(int(tags["track"]), 0)]
+    mp4["disk"] = [(int(tags["disc"]), 0)]
+    if art:
+        mp4["covr"] = [MP4Cover(art, imageformat=MP4Cover.FORMAT_PNG)]
+    mp4.save()
+
+
+def _write_wav(path: Path, tags: dict, art: bytes = None):
+    data = b"\x00" * 1764
+    fmt = struct.pack("<HHIIHH", 1, 2, 44100, 44100 * 4, 4, 16)
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt
+    body += b"data" + struct.pack("<I", len(data)) + data
+    path.write_bytes(b"RIFF" + struct.pack("<I", len(body)) + body)
+
+    wave = WAVE(path)
+    wave.add_tags()
+    wave.tags.add(TIT2(encoding=3, text=tags["title"]))
+    wave.tags.add(TPE1(encoding=3, text=tags["artist"]))
+    wave.tags.add(TALB(encoding=3, text=tags["album"]))
+    wave.tags.add(TRCK(encoding=3, text=tags["track"]))
+    wave.tags.add(TDRC(encoding=3, text=tags["year"]))
+    if art:
+        wave.tags.add(APIC(encoding=3, mime="image/png", type=3, desc="Cover", data=art))
+    wave.save()
+
+
+WRITERS = {"mp3": _write_mp3, "flac": _write_flac, "m4a": _write_m4a, "wav": _write_wav}
+
+
+def _atom(name: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I", 8 + len(payload)) + name + payload
+
+
+def _full_atom(name: bytes, payload: bytes) -> bytes:
+    return _atom(name, b"\x00\x00\x00\x00" + payload)
+
+
+def _m4a_template() -> bytes:
+    """A minimal AAC-in-MP4 file with no samples that mutagen can tag."""
+    timescale = 44100
+    mvhd = _full_atom(
+        b"mvhd",
+        struct.pack(">IIII", 0, 0, 1000, DURATION * 1000)
+        + struct.pack(">IH", 0x10000, 0x100) + b"\x00" * 10
+        + struct.pack(">9I", 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+        + b"\x00" * 24 + struct.pack(">I", 2),
+    )
+    mdhd = _full_atom(b"mdhd", struct.pack(">IIIIHH", 0, 0, timescale, timescale * DURATION, 0x55C4, 0))
+    hdlr = _full_atom(b"hdlr", struct.pack(">I", 0) + b"soun" + b"\x00" * 13)
+    esds = _full_atom(
+        b"esds",
+        bytes.fromhex("0319000000041140150000000001f4000001f40005021210060102"),
+    )
+    mp4a = _atom(
+        b"mp4a",
+        b"\x00" * 6 + struct.pack(">H", 1) + b"\x00" * 8
+        + struct.pack(">HHHHI", 2, 16, 0, 0, timescale << 16) + esds,
+    )
+    stbl = _atom(
+        b"stbl",
+        _full_atom(b"stsd", struct.pack(">I", 1) + mp4a)
+        + _full_atom(b"stts", struct.pack(">I", 0))
+        + _full_atom(b"stsc", struct.pack(">I", 0))
+        + _full_atom(b"stsz", struct.pack(">II", 0, 0))
+        + _full_atom(b"stco", struct.pack(">I", 0)),
+    )
+    minf = _atom(b"minf", _full_atom(b"smhd", b"\x00" * 4) + stbl)
+    trak = _atom(b"trak", _atom(b"mdia", mdhd + hdlr + minf))
+    return (
+        _atom(b"ftyp", b"M4A \x00\x00\x00\x00M4A mp42isom")
+        + _atom(b"moov", mvhd + trak)
+        + _atom(b"mdat", b"")
+    )
+
+
+_M4A_TEMPLATE = _m4a_template()
+
+
+def _png(width: int, height: int, rgb: tuple) -> bytes:
+    """Encode a solid-colour RGB PNG."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    row = b"\x00" + bytes(rgb) * width
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(row * height, 9))
+        + chunk(b"IEND", b"")
+    )
+
+
+def _words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+def _safe(name: str) -> str:
+    return name.replace("/", "-")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic tagged music library.")
+    parser.add_argument("root", type=Path, help="Directory to write the library into")
+    parser.add_argument("--tracks", type=int, default=1000)
+    parser.add_argument("--playlists", type=int, default=10)
+    parser.add_argument("--playlist-size", type=int, default=50)
+    parser.add_argument("--formats", default=",".join(FORMATS), help="Comma-separated list of formats")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    counts = generate_library(
+        args.root,
+        tracks=args.tracks,
+        playlists=args.playlists,
+        playlist_size=args.playlist_size,
+        formats=tuple(args.formats.split(",")),
+        seed=args.seed,
+    )
+    print(f"Generated {counts['tracks']} tracks, {counts['albums']} albums, "
+          f"{counts['artists']} artists and {counts['playlists']} playlists in {args.root}")
+
+
+if __name__ == "__main__":
+    main()
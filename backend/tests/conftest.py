@@ -0,0 +1,14 @@
+import os
+import tempfile
+
+# Settings are read on import, so point them at scratch folders before any
+# test imports the app
+_scratch = tempfile.mkdtemp(prefix="sonos-tests-")
+os.environ.update(
+    MUSIC_PATH=os.path.join(_scratch, "music"),
+    DATA_PATH=os.path.join(_scratch, "data"),
+    HOST_IP="127.0.0.1",
+    INDEX_ON_STARTUP="false",
+    INDEX_EXECUTOR="thread",
+)
+os.makedirs(os.environ["DATA_PATH"], exist_ok=True)
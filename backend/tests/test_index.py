@@ -0,0 +1,65 @@
+import asyncio
+import os
+from pathlib import Path
+
+from sqlalchemy import select
+
+from app import generation
+from app.config import settings
+from app.library import start_background_index
+from app.models import Playlist, PlaylistEntry, Track, async_session, init_db
+from benchmarks.synthetic_library import generate_library
+
+
+async def _index():
+    await start_background_index(force=True)
+
+
+async def _track_ids() -> dict:
+    async with async_session() as session:
+        return dict((await session.execute(select(Track.file_path, Track.id))).all())
+
+
+def _touch(path: Path, offset: int):
+    """Give a file a new mtime, so the indexer sees it as changed."""
+    mtime = path.stat().st_mtime + offset
+    os.utime(path, (mtime, mtime))
+
+
+def test_track_keeps_id_through_failed_parse():
+    async def run():
+        music = Path(settings.music_path)
+        generate_library(music, tracks=10, playlists=0, formats=("flac",))
+        await init_db()
+        await generation.load()
+        await _index()
+
+        ids = await _track_ids()
+        rel_path = sorted(ids)[0]
+        track_id = ids[rel_path]
+        async with async_session() as session:
+            playlist = Playlist(name="Favourites", is_user_created=True)
+            playlist.entries.append(
+                PlaylistEntry(track_id=track_id, track_path=rel_path, position=0)
+            )
+            session.add(playlist)
+            await session.commit()
+
+        # Truncated as if a tagger were mid-write: the file no longer parses
+        path = music / rel_path
+        data = path.read_bytes()
+        path.write_bytes(data[:16])
+        _touch(path, 10)
+        await _index()
+        assert (await _track_ids())[rel_path] == track_id
+
+        path.write_bytes(data)
+        _touch(path, 20)
+        await _index()
+        assert (await _track_ids())[rel_path] == track_id
+
+        async with async_session() as session:
+            entry = (await session.execute(select(PlaylistEntry))).scalar_one()
+        assert entry.track_id == track_id
+
+    asyncio.run(run())
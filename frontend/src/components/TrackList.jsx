@@ -18,7 +18,7 @@ function TrackList({ tracks, showAlbum = true }) {
           <div className="track-title-cell">
             <div className="album-art album-art-sm">
               {track.art_url ? (
-                <img src={track.art_url} alt="" />
+                <img src={track.art_thumbnails?.['150'] || track.art_url} alt="" />
               ) : (
                 <div className="album-art-placeholder">
                   <MusicIcon />
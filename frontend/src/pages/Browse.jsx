@@ -70,18 +70,50 @@ function BrowseHome() {
   )
 }
 
-function ArtistList() {
-  const [artists, setArtists] = useState([])
+// Fetch a list page by page, following the cursor of each response
+function usePagedList(url, key) {
+  const [items, setItems] = useState([])
+  const [nextCursor, setNextCursor] = useState(null)
   const [loading, setLoading] = useState(true)
+  const [loadingMore, setLoadingMore] = useState(false)
 
-  useEffect(() => {
-    fetch('/api/library/artists?limit=500')
+  const fetchPage = (cursor) => {
+    const query = cursor ? `&cursor=${encodeURIComponent(cursor)}` : ''
+    return fetch(`${url}?limit=500${query}`)
       .then(r => r.json())
       .then(data => {
-        setArtists(data.artists)
-        setLoading(false)
+        setItems(prev => cursor ? [...prev, ...data[key]] : data[key])
+        setNextCursor(data.next_cursor)
       })
-  }, [])
+  }
+
+  useEffect(() => {
+    fetchPage(null).then(() => setLoading(false))
+  }, [url])
+
+  const loadMore = () => {
+    setLoadingMore(true)
+    fetchPage(nextCursor).then(() => setLoadingMore(false))
+  }
+
+  return { items, loading, hasMore: !!nextCursor, loadingMore, loadMore }
+}
+
+function LoadMore({ list }) {
+  if (!list.hasMore) return null
+
+  return (
+    <div style={{ marginTop: 24, textAlign: 'center' }}>
+      <button className="btn btn-secondary" onClick={list.loadMore} disabled={list.loadingMore}>
+        {list.loadingMore ? 'Loading...' : 'Load more'}
+      </button>
+    </div>
+  )
+}
+
+function ArtistList() {
+  const list = usePagedList('/api/library/artists', 'artists')
+  const { items: artists, loading } = list
 
   if (loading) return <div className="loading"><div className="spinner" /></div>
 
@@ -108,6 +140,7 @@ function ArtistList() {
           </Link>
         ))}
       </div>
+      <LoadMore list={list} />
     </div>
   )
 }
@@ -159,17 +192,8 @@ function ArtistDetail() {
 }
 
 function AlbumList() {
-  const [albums, setAlbums] = useState([])
-  const [loading, setLoading] = useState(true)
-
-  useEffect(() => {
-    fetch('/api/library/albums?limit=500')
-      .then(r => r.json())
-      .then(data => {
-        setAlbums(data.albums)
-        setLoading(false)
-      })
-  }, [])
+  const list = usePagedList('/api/library/albums', 'albums')
+  const { items: albums, loading } = list
 
   if (loading) return <div className="loading"><div className="spinner" /></div>
 
@@ -196,6 +220,7 @@ function AlbumList() {
           </Link>
         ))}
       </div>
+      <LoadMore list={list} />
     </div>
   )
 }
@@ -229,7 +254,7 @@ function AlbumDetail() {
       <div className="album-detail-header">
         <div className="album-art album-detail-art">
           {tracks[0]?.art_url ? (
-            <img src={tracks[0].art_url} alt="" />
+            <img src={tracks[0].art_thumbnails?.['600'] || tracks[0].art_url} alt="" />
           ) : (
             <div className="album-art-placeholder">
               <AlbumIcon />